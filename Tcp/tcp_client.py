@@ -1,10 +1,18 @@
+import time
+# Taken before anything else is imported so the startup timings cover the whole launch
+STARTED = time.perf_counter()
 import asyncio
 import tkinter as tk
-from tkinter import messagebox
 import threading
 import json
-import time
+import socket
+from collections import deque
 import logging
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from framing import read_frame
+from scribble import CONGESTION_DRAIN, CONGESTION_QUEUE, ERASE_RADIUS, CanvasIndex, RateController, decimate
 
 logging.basicConfig(filename='tcp_client.log', level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,14 +20,36 @@ logger = logging.getLogger(__name__)
 
 SERVER_HOST = "localhost"
 SERVER_PORT = 4433
+HEARTBEAT_TIMEOUT = 15
+RECONNECT_DELAY = 1
+RECONNECT_ATTEMPTS = 30
+# Adaptive stroke sending, points are batched and thinned while the connection is congested
+BATCH_INTERVAL = 0.02
+MAX_BATCH_INTERVAL = 0.3
+MAX_TOLERANCE = 6.0
 
 class ScribbleClientGUI:
-    def __init__(self, root):
+    def __init__(self):
+        # Connection state only, the network thread starts on it while Tk is still coming up
         self.loop = None
+        self.username = None
+        self.session_token = None
+        self.host = SERVER_HOST
+        self.port = SERVER_PORT
+        self.room = None
+        self.redirected = False
+        self.rooms = {}
+        self.leaders = []
+        self.outgoing = deque()
+        self.rate = RateController(BATCH_INTERVAL, 0.0, MAX_BATCH_INTERVAL, MAX_TOLERANCE)
+        self.writer = None
+        self.ui_ready = threading.Event()
+        self.startup = {}
+
+    def build_ui(self, root):
         self.root = root
         self.root.title("Scribble Game Client (TCP)")
-        
-        self.username = None
+
         self.last_draw_time = None
         self.current_color = "black"
         self.erase_mode = False
@@ -29,6 +59,9 @@ class ScribbleClientGUI:
         tk.Label(self.username_frame, text="Username:").pack(side=tk.LEFT)
         self.username_entry = tk.Entry(self.username_frame)
         self.username_entry.pack(side=tk.LEFT, padx=5)
+        tk.Label(self.username_frame, text="Room:").pack(side=tk.LEFT)
+        self.room_entry = tk.Entry(self.username_frame, width=10)
+        self.room_entry.pack(side=tk.LEFT, padx=5)
         self.set_username_button = tk.Button(self.username_frame, text="Set Username", command=self.set_username)
         self.set_username_button.pack(side=tk.LEFT)
 
@@ -40,6 +73,11 @@ class ScribbleClientGUI:
         self.is_drawer = False
         self.last_x = None
         self.last_y = None
+        self.index = CanvasIndex()
+        self.remote_items = {}
+        # Our own sent points (x, y, raw canvas line) until the server echoes them back
+        self.provisional = deque()
+        self.echo_last = None
 
         self.color_buttons = {}
         colors = [("Black", "black"), ("Red", "red"), ("Blue", "blue"), ("Green", "green")]
@@ -61,12 +99,35 @@ class ScribbleClientGUI:
 
         self.ready_button = tk.Button(root, text="I'm Ready", command=self.send_ready, state="disabled")
         self.ready_button.pack(pady=5)
+        self.spectate_button = tk.Button(root, text="Spectate", command=self.send_spectate)
+        self.spectate_button.pack(pady=5)
+        self.is_spectator = False
 
         self.status = tk.Label(root, text="Not connected")
         self.status.pack()
+        self.lobby_label = tk.Label(root, text="")
+        self.lobby_label.pack()
 
         self.word_buttons = []
-        self.writer = None
+        self.root.bind("<Expose>", self.first_frame)
+        self.ui_ready.set()
+
+    def first_frame(self, event):
+        self.root.unbind("<Expose>")
+        self.mark_startup("first_frame")
+
+    def mark_startup(self, milestone):
+        # Time since launch of the first frame, the TCP connect and the first server reply
+        if milestone in self.startup:
+            return
+        self.startup[milestone] = (time.perf_counter() - STARTED) * 1000
+        logger.info(f"Startup: {milestone} after {self.startup[milestone]:.1f}ms")
+        if len(self.startup) == 3:
+            print("Startup: first frame {first_frame:.1f}ms, connected {connected:.1f}ms, first reply {first_reply:.1f}ms".format(**self.startup))
+
+    async def wait_for_ui(self):
+        if not self.ui_ready.is_set():
+            await self.loop.run_in_executor(None, self.ui_ready.wait)
 
     def set_username(self):
         username = self.username_entry.get().strip()
@@ -75,15 +136,26 @@ class ScribbleClientGUI:
             self.status.config(text=f"Username set: {username}")
             self.ready_button.config(state="normal")
             self.username_entry.config(state="disabled")
+            self.room_entry.config(state="disabled")
             self.set_username_button.config(state="disabled")
+            self.room = self.room_entry.get().strip() or None
             if self.writer and self.loop:
-                self.writer.write(f"USERNAME:{username}\n".encode())
+                if self.room:
+                    # The username follows once the server confirms it hosts the room
+                    self.writer.write(f"ROOM:{self.room}\n".encode())
+                else:
+                    self.writer.write(f"USERNAME:{username}\n".encode())
                 asyncio.run_coroutine_threadsafe(self.writer.drain(), self.loop)
-                logger.info(f"Username set to {username}")
+                logger.info(f"Username set to {username}, room {self.room}")
         else:
             logger.warning("Attempted to set invalid username")
             self.status.config(text="Please enter a valid username")
 
+    def update_lobby(self):
+        rooms = ", ".join(f"{room} ({count})" for room, count in sorted(self.rooms.items()))
+        leaders = ", ".join(f"{name} {score}" for name, _, score in self.leaders[:3])
+        self.lobby_label.config(text=f"Rooms: {rooms or '-'}   Top: {leaders or '-'}")
+
     def set_color(self, color):
         self.current_color = color
         for c, btn in self.color_buttons.items():
@@ -107,36 +179,48 @@ class ScribbleClientGUI:
         x, y = event.x, event.y
 
         if self.erase_mode:
-            if self.writer and self.loop:
-                msg = json.dumps({"type": "erase", "x": x, "y": y})
-                self.writer.write(f"{msg}\n".encode())
-                asyncio.run_coroutine_threadsafe(self.writer.drain(), self.loop)
-                logger.info(f"Sent erase event at ({x}, {y})")
-            self.canvas.create_rectangle(x-2, y-2, x+2, y+2, fill="white", outline="white")
+            # The server decides what goes, on the simplified segments everyone sees, and sends the
+            # ids back to us as well. The local hit-test only skips erases that cannot hit anything.
+            if self.index.hits(x, y, ERASE_RADIUS) and self.writer and self.loop:
+                # Queued behind the pending points so the server erases what we drew
+                self.outgoing.append({"type": "erase", "x": x, "y": y})
+                logger.info(f"Queued erase event at ({x}, {y})")
         else:
             if self.last_draw_time is not None and (current_time - self.last_draw_time) > 0.1:
                 self.last_x = None
                 self.last_y = None
 
-            if self.last_x is not None:
-                self.canvas.create_line(self.last_x, self.last_y, x, y, fill=self.current_color, width=3)
+            start_new = self.last_x is None
+            item = None
+            if not start_new:
+                item = self.add_line(self.last_x, self.last_y, x, y, self.current_color)
             self.last_draw_time = current_time
             self.last_x, self.last_y = x, y
 
             if self.writer and self.loop:
-                msg = json.dumps({"type": "draw", "x": x, "y": y, "color": self.current_color})
-                self.writer.write(f"{msg}\n".encode())
-                asyncio.run_coroutine_threadsafe(self.writer.drain(), self.loop)
-                logger.info(f"Sent draw event at ({x}, {y}) with color {self.current_color}")
+                self.provisional.append((x, y, item))
+                self.outgoing.append({"type": "draw", "x": x, "y": y, "color": self.current_color, "start_new": start_new})
 
     def send_ready(self):
         if self.writer and self.loop and self.username:
             self.writer.write(b"READY\n")
             asyncio.run_coroutine_threadsafe(self.writer.drain(), self.loop)
+            self.is_spectator = False
+            self.spectate_button.config(state="disabled")
             self.status.config(text="Sent READY")
             self.ready_button.config(state="disabled")
             logger.info(f"Sent READY signal")
 
+    def send_spectate(self):
+        if self.writer and self.loop:
+            self.writer.write(b"SPECTATE\n")
+            asyncio.run_coroutine_threadsafe(self.writer.drain(), self.loop)
+            self.is_spectator = True
+            self.status.config(text="Spectating")
+            self.spectate_button.config(state="disabled")
+            self.guess_frame.pack_forget()
+            logger.info("Sent SPECTATE signal")
+
     def send_guess(self):
         guess = self.guess_entry.get().strip()
         if guess and self.writer and self.loop:
@@ -158,22 +242,79 @@ class ScribbleClientGUI:
 
     def clear_canvas(self):
         self.canvas.delete("all")
+        self.index = CanvasIndex()
+        self.remote_items = {}
+        self.provisional.clear()
+        self.echo_last = None
         self.last_x = None
         self.last_y = None
         self.last_draw_time = None
         logger.info("Canvas cleared")
 
+    def add_line(self, x1, y1, x2, y2, color, remote_id=None):
+        item = self.canvas.create_line(x1, y1, x2, y2, fill=color, width=3)
+        self.index.add(x1, y1, x2, y2, color, seg_id=item)
+        if remote_id is not None:
+            self.remote_items[remote_id] = item
+        return item
+
+    def render_draw(self, msg):
+        x, y = msg["x"], msg["y"]
+        color = msg.get("color", "black")
+        if msg.get("start_new", False):
+            self.last_x = None
+            self.last_y = None
+        if self.last_x is not None:
+            self.add_line(self.last_x, self.last_y, x, y, color, msg.get("id"))
+        self.last_x, self.last_y = x, y
+
+    def confirm_draw(self, msg):
+        # Our own stroke as the server simplified and numbered it. The raw lines up to this point
+        # are swapped for the segment the guessers got, so erases hit the same lines everywhere.
+        x, y = msg["x"], msg["y"]
+        sent = list(self.provisional)
+        end = next((i for i, (px, py, _) in enumerate(sent) if (px, py) == (x, y)), None)
+        if end is not None:
+            for _ in range(end + 1):
+                _, _, item = self.provisional.popleft()
+                if item is not None:
+                    self.canvas.delete(item)
+                    self.index.remove(item)
+        if msg.get("start_new", False):
+            self.echo_last = None
+        if self.echo_last is not None:
+            self.add_line(*self.echo_last, x, y, msg.get("color", "black"), msg.get("id"))
+        self.echo_last = (x, y)
+
+    def render_erase(self, msg):
+        for remote_id in msg["ids"]:
+            item = self.remote_items.pop(remote_id, None)
+            if item is not None:
+                self.canvas.delete(item)
+                self.index.remove(item)
+
     async def listen_server(self, reader):
         while True:
-            data = await reader.read(1024)
+            try:
+                data = await asyncio.wait_for(read_frame(reader), HEARTBEAT_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"No data from server for {HEARTBEAT_TIMEOUT}s, assuming connection is dead")
+                self.status.config(text="Connection lost")
+                break
             if not data:
                 logger.warning("No data received, connection likely closed")
+                self.status.config(text="Connection lost")
                 break
+            self.mark_startup("first_reply")
             messages = data.decode().strip().split("\n")
             for message in messages:
                 try:
                     msg = json.loads(message)
                     msg_type = msg.get("type")
+                    if msg_type == "ping":
+                        self.writer.write(b"PONG\n")
+                        await self.writer.drain()
+                        continue
                     logger.info(f"Received message: {message}")
 
                     if msg_type == "status":
@@ -205,36 +346,99 @@ class ScribbleClientGUI:
                         self.is_drawer = False
                         self.clear_canvas()
                         self.status.config(text=msg["message"])
-                        self.guess_frame.pack()
+                        if not self.is_spectator:
+                            self.guess_frame.pack()
                         logger.info(f"Started guess round: {msg['message']}")
 
                     elif msg_type == "draw":
-                        if not self.is_drawer:
-                            x, y = msg["x"], msg["y"]
-                            color = msg.get("color", "black")
-                            start_new = msg.get("start_new", False)
-                            if start_new:
-                                self.last_x = None
-                                self.last_y = None
-                            if self.last_x is not None:
-                                self.canvas.create_line(self.last_x, self.last_y, x, y, fill=color, width=3)
-                            self.last_x, self.last_y = x, y
-                            logger.info(f"Received draw at ({x}, {y}) with color {color}")
+                        if self.is_drawer:
+                            self.confirm_draw(msg)
+                        else:
+                            self.render_draw(msg)
+                            logger.info(f"Received draw at ({msg['x']}, {msg['y']}) with color {msg.get('color', 'black')}")
 
                     elif msg_type == "erase":
-                        if not self.is_drawer:
-                            x, y = msg["x"], msg["y"]
-                            self.canvas.create_rectangle(x-2, y-2, x+2, y+2, fill="white", outline="white")
-                            logger.info(f"Received erase at ({x}, {y})")
+                        self.render_erase(msg)
+                        logger.info(f"Received erase of {len(msg['ids'])} items")
+
+                    elif msg_type == "compress":
+                        logger.info(f"Server compression: {msg['algo']}")
+
+                    elif msg_type == "room":
+                        if self.username and not self.session_token:
+                            self.writer.write(f"USERNAME:{self.username}\n".encode())
+                            await self.writer.drain()
+                        self.status.config(text=f"Joined room {msg['name']}")
+                    elif msg_type == "redirect":
+                        # Another node hosts this room, reconnect there and ask again
+                        self.host, self.port = msg["host"], msg["port"]
+                        self.redirected = True
+                        logger.info(f"Redirected to {self.host}:{self.port} for room {msg['room']}")
+                        self.status.config(text=f"Room {msg['room']} is on {self.host}:{self.port}, moving...")
+                        return
+                    elif msg_type == "lobby":
+                        self.rooms = msg["rooms"]
+                        self.update_lobby()
+                    elif msg_type == "leaderboard":
+                        self.leaders = msg["top"]
+                        self.update_lobby()
+
+                    elif msg_type == "session":
+                        self.session_token = msg["token"]
+                        logger.info("Received session token")
+
+                    elif msg_type == "resumed":
+                        self.username = msg["name"]
+                        self.clear_canvas()
+                        for btn in self.word_buttons:
+                            btn.destroy()
+                        self.word_buttons = []
+                        round_info = msg["round"]
+                        self.is_drawer = round_info is not None and round_info["role"] == "draw"
+                        for remote_id, x1, y1, x2, y2, color in msg["canvas"]:
+                            self.add_line(x1, y1, x2, y2, color, remote_id)
+                        if round_info:
+                            self.status.config(text=f"Reconnected! {round_info['remaining']}s left in this round.")
+                        else:
+                            self.status.config(text=f"Reconnected as {self.username}. Score: {msg['score']}")
+                        if self.is_drawer:
+                            self.guess_frame.pack_forget()
+                        else:
+                            self.guess_frame.pack()
+                        self.ready_button.config(state="disabled" if msg["ready"] else "normal")
+                        logger.info(f"Resumed session as {self.username} with {len(msg['canvas'])} canvas items")
+
+                    elif msg_type == "spectate":
+                        self.is_drawer = False
+                        self.clear_canvas()
+                        for remote_id, x1, y1, x2, y2, color in msg["canvas"]:
+                            self.add_line(x1, y1, x2, y2, color, remote_id)
+                        round_info = msg["round"]
+                        if round_info:
+                            self.status.config(text=f"Spectating: {round_info['drawer']} is drawing a {round_info['length']} letter word ({round_info['remaining']}s left)")
+                        else:
+                            self.status.config(text="Spectating, waiting for the next round")
+                        logger.info("Started spectating")
+
+                    elif msg_type == "resume_failed":
+                        self.session_token = None
+                        self.username = None
+                        self.status.config(text=msg["message"])
+                        self.username_entry.config(state="normal")
+                        self.set_username_button.config(state="normal")
+                        self.ready_button.config(state="disabled")
+                        logger.warning("Session resume rejected by server")
 
                     elif msg_type == "round_end":
                         self.is_drawer = False
                         self.status.config(text=msg["message"])
                         scores = msg["scores"]
                         score_text = "\n".join([f"{name}: {score}" for name, score in scores.items()])
-                        messagebox.showinfo("Round End", f"{msg['message']}\n\nScores:\n{score_text}")
+                        from tkinter import messagebox
+                        self.root.after(0, messagebox.showinfo, "Round End", f"{msg['message']}\n\nScores:\n{score_text}")
                         self.clear_canvas()
-                        self.guess_frame.pack()
+                        if not self.is_spectator:
+                            self.guess_frame.pack()
                         for btn in self.word_buttons:
                             btn.destroy()
                         self.word_buttons = []
@@ -243,31 +447,86 @@ class ScribbleClientGUI:
                 except json.JSONDecodeError:
                     logger.error(f"Invalid JSON received: {message}")
 
+    async def send_strokes(self, writer):
+        # Sends queued drawer events in batches, thinning points while the socket is backed up
+        while True:
+            await asyncio.sleep(self.rate.interval)
+            if not self.outgoing:
+                continue
+            messages = []
+            while self.outgoing:
+                messages.append(self.outgoing.popleft())
+            kept = decimate(messages, self.rate.tolerance)
+            writer.writelines([json.dumps(msg).encode() + b"\n" for msg in kept])
+            started = time.perf_counter()
+            try:
+                await writer.drain()
+            except ConnectionError:
+                return
+            drain_latency = time.perf_counter() - started
+            self.rate.update(writer.transport.get_write_buffer_size() > CONGESTION_QUEUE or drain_latency > CONGESTION_DRAIN)
+            logger.info(f"Sent {len(kept)}/{len(messages)} drawer events, batching {self.rate.interval * 1000:.0f}ms, tolerance {self.rate.tolerance:.1f}px")
+
     async def start_tcp(self):
         self.loop = asyncio.get_running_loop()
-        logger.info(f"Attempting to connect to {SERVER_HOST}:{SERVER_PORT}")
-        try:
-            reader, writer = await asyncio.open_connection(SERVER_HOST, SERVER_PORT)
-            self.writer = writer
-            logger.info(f"Successfully connected to {SERVER_HOST}:{SERVER_PORT}")
-            self.status.config(text="Connected to TCP server")
-            print(time.time())
-            await self.listen_server(reader)
-        except ConnectionError as e:
-            logger.error(f"Connection failed to {SERVER_HOST}:{SERVER_PORT}: {e}")
-            self.status.config(text=f"Connection Error: {e}")
-        except Exception as e:
-            logger.error(f"Unexpected error during connection: {e}")
-            self.status.config(text=f"Error: {e}")
+        attempts = 0
+        while attempts <= RECONNECT_ATTEMPTS:
+            logger.info(f"Attempting to connect to {self.host}:{self.port}")
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+                # Stroke messages are tiny, never let Nagle hold them back
+                writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.mark_startup("connected")
+                logger.info(f"Successfully connected to {self.host}:{self.port}")
+                writer.write(b"COMPRESS:zlib\n")
+                if self.session_token:
+                    # Server answers with the whole player and canvas state in one message
+                    writer.write(f"RESUME:{self.session_token}\n".encode())
+                    await writer.drain()
+                    logger.info("Sent session resume request")
+                if self.room:
+                    writer.write(f"ROOM:{self.room}\n".encode())
+                elif self.username and not self.session_token:
+                    # Set while we were still connecting or reconnecting, the server has not heard it yet
+                    writer.write(f"USERNAME:{self.username}\n".encode())
+                await self.wait_for_ui()
+                self.writer = writer
+                attempts = 0
+                self.status.config(text="Connected to TCP server")
+                self.outgoing.clear()
+                sender = asyncio.create_task(self.send_strokes(writer))
+                try:
+                    await self.listen_server(reader)
+                finally:
+                    sender.cancel()
+                writer.close()
+            except ConnectionError as e:
+                logger.error(f"Connection failed to {self.host}:{self.port}: {e}")
+                await self.wait_for_ui()
+                self.status.config(text=f"Connection Error: {e}")
+            except Exception as e:
+                logger.error(f"Unexpected error during connection: {e}")
+                await self.wait_for_ui()
+                self.status.config(text=f"Error: {e}")
+            self.writer = None
+            if self.redirected:
+                self.redirected = False
+                continue
+            attempts += 1
+            if attempts <= RECONNECT_ATTEMPTS:
+                self.status.config(text=f"Reconnecting ({attempts}/{RECONNECT_ATTEMPTS})...")
+                await asyncio.sleep(RECONNECT_DELAY)
 
 def run_gui():
-    root = tk.Tk()
-    app = ScribbleClientGUI(root)
+    # The connection starts first, the TCP handshake runs while Tk opens the display and builds the window
+    app = ScribbleClientGUI()
 
     def run_asyncio():
         asyncio.run(app.start_tcp())
 
     threading.Thread(target=run_asyncio, daemon=True).start()
+    root = tk.Tk()
+    app.build_ui(root)
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import contextlib
+import cProfile
+import importlib.util
+import json
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import time
+
+import memory_transport
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SERVERS = {
+    "tcp": ("Tcp", "tcp_server.py"),
+    "quic": ("quic", "quic_server.py"),
+}
+
+def load_server(kind, workdir):
+    # The servers expect to run from their own directory with metrics/ and replays/ next to it,
+    # so they get a throwaway copy of that layout instead of overwriting the real metrics
+    folder, filename = SERVERS[kind]
+    os.makedirs(os.path.join(workdir, "metrics"))
+    os.makedirs(os.path.join(workdir, "replays"))
+    rundir = os.path.join(workdir, folder)
+    os.makedirs(rundir)
+    shutil.copy(os.path.join(ROOT, "words.txt"), rundir)
+    os.chdir(rundir)
+    spec = importlib.util.spec_from_file_location(f"bench_{kind}_server", os.path.join(ROOT, folder, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class BenchPlayer:
+    def __init__(self, name, reader, writer):
+        self.name = name
+        self.reader = reader
+        self.writer = writer
+        self.messages = 0
+        self.draws = 0
+        self.bytes_received = 0
+        self.options = None
+        self.inbox = asyncio.Queue()
+
+    def send(self, line):
+        self.writer.write(line.encode() + b"\n")
+
+    async def run(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            self.messages += 1
+            self.bytes_received += len(line)
+            if line.startswith(b'{"type": "draw"'):
+                self.draws += 1
+                continue
+            msg = json.loads(line)
+            if msg["type"] == "ping":
+                self.send("PONG")
+            elif msg["type"] == "word_options":
+                self.options = msg
+            else:
+                self.inbox.put_nowait(msg)
+
+    async def wait_for(self, msg_type):
+        while True:
+            msg = await self.inbox.get()
+            if msg["type"] == msg_type:
+                return msg
+
+def stroke_points(count, batch):
+    # Zig-zag strokes so simplification keeps a realistic share of the points
+    lines = []
+    for i in range(count):
+        x = 50 + (i * 3) % 500
+        y = 100 + (i % 7) * 9 + (i // 500) % 200
+        msg = {"type": "draw", "x": x, "y": y, "color": "black", "start_new": i % 500 == 0}
+        lines.append(json.dumps(msg).encode() + b"\n")
+        if len(lines) == batch:
+            yield b"".join(lines)
+            lines = []
+    if lines:
+        yield b"".join(lines)
+
+async def run_round(args, module):
+    if args.server == "tcp":
+        handler = module.ScribbleTCPServer().handle_client
+    else:
+        handler = module.stream_handler_wrapper
+    server = None
+    if args.transport == "memory":
+        connect = lambda: memory_transport.open_connection(handler)
+    else:
+        server = await asyncio.start_server(handler, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        connect = lambda: asyncio.open_connection("127.0.0.1", port)
+
+    players = []
+    for i in range(args.players):
+        reader, writer = await connect()
+        player = BenchPlayer(f"p{i}", reader, writer)
+        player.task = asyncio.create_task(player.run())
+        player.send(f"USERNAME:{player.name}")
+        await player.wait_for("session")
+        players.append(player)
+    for player in players:
+        player.send("READY")
+
+    drawer = None
+    while drawer is None:
+        await asyncio.sleep(0.05)
+        drawer = next((p for p in players if p.options), None)
+    word = drawer.options["words"][0]
+    drawer.send(json.dumps({"type": "chosen_word", "word": word}))
+    await drawer.wait_for("draw_round")
+    guessers = [p for p in players if p is not drawer]
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    for chunk in stroke_points(args.points, args.batch):
+        drawer.writer.write(chunk)
+        await drawer.writer.drain()
+        await asyncio.sleep(0)
+    # The round loop consumes points on its own ticks, wait until it has seen all of them
+    while module.current_round is not None and module.current_round["drawer"].points_in < args.points:
+        await asyncio.sleep(0.001)
+    points_in = module.current_round["drawer"].points_in if module.current_round else 0
+    points_out = module.current_round["drawer"].points_out if module.current_round else 0
+    guessers[0].send(f"GUESS:{word}")
+    await guessers[0].wait_for("round_end")
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    for player in players:
+        player.writer.close()
+        player.task.cancel()
+    if server is not None:
+        server.close()
+    # Let the connection handlers see EOF and return before the loop shuts down
+    await asyncio.sleep(0.1)
+    return {
+        "points_in": points_in,
+        "points_out": points_out,
+        "draws_received": sum(p.draws for p in guessers),
+        "bytes_received": sum(p.bytes_received for p in guessers),
+        "wall": wall,
+        "cpu": cpu,
+    }
+
+def report(args, stats):
+    print(f"{args.server} game core over {args.transport} transport, {args.players} players")
+    print(f"Drawer points processed: {stats['points_in']} ({stats['points_in'] / stats['wall']:,.0f}/s)")
+    print(f"Points forwarded after simplification: {stats['points_out']}")
+    print(f"Draw messages delivered to guessers: {stats['draws_received']} ({stats['draws_received'] / stats['wall']:,.0f}/s)")
+    print(f"Bytes delivered to guessers: {stats['bytes_received']}")
+    print(f"Wall time (s): {stats['wall']:.3f}  CPU time (s): {stats['cpu']:.3f}")
+    print(f"CPU per drawer point (us): {stats['cpu'] / max(stats['points_in'], 1) * 1e6:.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the game logic without a network in between")
+    parser.add_argument("--server", choices=sorted(SERVERS), default="tcp", help="which server's game core to drive")
+    parser.add_argument("--transport", choices=["memory", "socket"], default="memory",
+                        help="memory: in-process pipes, socket: loopback TCP for comparison (tcp server only)")
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--points", type=int, default=20000, help="drawer points to push through one round")
+    parser.add_argument("--batch", type=int, default=50, help="points per drawer write")
+    parser.add_argument("--record", action="store_true", help="keep writing replay files (off by default)")
+    parser.add_argument("--profile", action="store_true", help="print the top functions by own time")
+    parser.add_argument("--verbose", action="store_true", help="show the server's own logging")
+    args = parser.parse_args()
+    if args.transport == "socket" and args.server != "tcp":
+        parser.error("--transport socket only applies to the tcp server")
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        module = load_server(args.server, workdir)
+        module.RECORD_REPLAYS = args.record
+        profiler = cProfile.Profile() if args.profile else None
+        # The servers print every message they receive, which would swamp the report
+        devnull = open(os.devnull, "w")
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)
+        try:
+            with output:
+                if profiler:
+                    profiler.enable()
+                stats = asyncio.run(run_round(args, module))
+                if profiler:
+                    profiler.disable()
+        finally:
+            devnull.close()
+            os.chdir(cwd)
+    report(args, stats)
+    if profiler:
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats("tottime").print_stats(20)
+
+if __name__ == "__main__":
+    main()
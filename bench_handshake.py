@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+HOST = "localhost"
+PORT = 4433
+PROBE_INTERVAL = 0.02
+
+def bench_signing(duration):
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+
+    # The TLS 1.3 CertificateVerify signs a ~130 byte transcript
+    message = b"\x20" * 64 + b"TLS 1.3, server CertificateVerify\x00" + b"\x00" * 32
+    rsa_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    ec_key = ec.generate_private_key(ec.SECP256R1())
+    ed_key = ed25519.Ed25519PrivateKey.generate()
+    signers = {
+        "RSA-2048 (PSS)": lambda: rsa_key.sign(
+            message, padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=32), hashes.SHA256()),
+        "ECDSA P-256": lambda: ec_key.sign(message, ec.ECDSA(hashes.SHA256())),
+        "Ed25519": lambda: ed_key.sign(message),
+    }
+    for name, sign in signers.items():
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            sign()
+            count += 1
+        elapsed = time.perf_counter() - start
+        print(f"{name:<16} {count / elapsed:10.0f} signatures/s  {elapsed / count * 1000:.3f} ms each")
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+async def handshake(host, port, cert, ticket):
+    from aioquic.asyncio import connect
+    from aioquic.quic.configuration import QuicConfiguration
+    configuration = QuicConfiguration(alpn_protocols=["scribble"], is_client=True, server_name=host)
+    configuration.load_verify_locations(cert)
+    configuration.session_ticket = ticket
+    new_tickets = []
+    start = time.perf_counter()
+    try:
+        async with connect(host, port, configuration=configuration, session_ticket_handler=new_tickets.append) as protocol:
+            elapsed = time.perf_counter() - start
+            # Give the server a moment to send the ticket before closing
+            await protocol.ping()
+    except (ConnectionError, asyncio.TimeoutError):
+        return None, None
+    return elapsed, (new_tickets[-1] if new_tickets else None)
+
+def storm_worker(host, port, cert, tickets):
+    # Runs in its own process so client-side crypto does not skew the server numbers
+    async def run():
+        return await asyncio.gather(*(handshake(host, port, cert, ticket) for ticket in tickets))
+    return asyncio.run(run())
+
+async def probe(args, stop, samples):
+    # An established connection pinging throughout the storm shows how much the
+    # handshakes delay everyone already playing
+    from aioquic.asyncio import connect
+    from aioquic.quic.configuration import QuicConfiguration
+    configuration = QuicConfiguration(alpn_protocols=["scribble"], is_client=True, server_name=args.host)
+    configuration.load_verify_locations(args.cert)
+    async with connect(args.host, args.port, configuration=configuration) as protocol:
+        while not stop.is_set():
+            start = time.perf_counter()
+            await protocol.ping()
+            samples.append(time.perf_counter() - start)
+            await asyncio.sleep(PROBE_INTERVAL)
+
+async def storm(args, pool, tickets, label):
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    rtts = []
+    probe_task = asyncio.create_task(probe(args, stop, rtts))
+    await asyncio.sleep(0.2)
+    chunks = [tickets[i::args.processes] for i in range(args.processes)]
+    start = time.perf_counter()
+    parts = await asyncio.gather(*(
+        loop.run_in_executor(pool, storm_worker, args.host, args.port, args.cert, chunk) for chunk in chunks))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+
+    results = [result for part in parts for result in part]
+    times = [t * 1000 for t, _ in results if t is not None]
+    print(f"{label}: {len(times)}/{args.connections} handshakes in {elapsed:.3f}s ({len(times) / elapsed:.1f}/s)")
+    if times:
+        print(f"  handshake ms  p50 {percentile(times, 50):.1f}  p95 {percentile(times, 95):.1f}  p99 {percentile(times, 99):.1f}")
+    if rtts:
+        rtts = [r * 1000 for r in rtts]
+        print(f"  in-game ping ms  median {statistics.median(rtts):.1f}  max {max(rtts):.1f}")
+    return [ticket for _, ticket in results]
+
+async def run_storm(args):
+    with ProcessPoolExecutor(args.processes) as pool:
+        tickets = await storm(args, pool, [None] * args.connections, "Full handshakes")
+        if args.resume:
+            resumable = sum(ticket is not None for ticket in tickets)
+            print(f"Session tickets received: {resumable}/{args.connections}")
+            await storm(args, pool, tickets, "Resumed handshakes")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure QUIC handshake cost")
+    parser.add_argument("mode", choices=["sign", "storm"], help="sign: compare key types, storm: concurrent joins against a running quic_server.py")
+    parser.add_argument("--duration", type=float, default=1.0, help="sign mode: seconds per key type")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--cert", default="server_cert.pem")
+    parser.add_argument("--connections", type=int, default=200, help="storm mode: simultaneous handshakes")
+    parser.add_argument("--processes", type=int, default=4, help="storm mode: client processes sharing the connections")
+    parser.add_argument("--resume", action="store_true", help="storm mode: repeat the storm with session tickets")
+    args = parser.parse_args()
+
+    if args.mode == "sign":
+        bench_signing(args.duration)
+    else:
+        asyncio.run(run_storm(args))
+
+if __name__ == "__main__":
+    main()
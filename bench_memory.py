@@ -0,0 +1,137 @@
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import memory_transport
+from bench_game import SERVERS, load_server
+
+def traced():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+def bare_clients(module, count):
+    # Just the server's per-player object, as it sits in the lobby before drawing anything
+    before = traced()
+    objects = [module.Client(None, None, None) for _ in range(count)]
+    size = traced() - before
+    del objects
+    return size / count
+
+async def wait_for(reader, msg_type):
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        msg = json.loads(line)
+        if msg["type"] == msg_type:
+            return msg
+
+async def connect_player(handler, name):
+    reader, writer = await memory_transport.open_connection(handler)
+    writer.write(f"USERNAME:{name}\n".encode())
+    await wait_for(reader, "session")
+    return reader, writer
+
+async def start_round(module, handler):
+    # A drawer and a guesser play a real round, the server only queues the current drawer's points
+    players = [await connect_player(handler, name) for name in ("p1", "p2")]
+    for _, writer in players:
+        writer.write(b"READY\n")
+    offers = {asyncio.create_task(wait_for(reader, "word_options")): (reader, writer) for reader, writer in players}
+    done, waiting = await asyncio.wait(offers, return_when=asyncio.FIRST_COMPLETED)
+    for task in waiting:
+        task.cancel()
+    offer = done.pop()
+    reader, writer = offers[offer]
+    writer.write(json.dumps({"type": "chosen_word", "word": offer.result()["words"][0]}).encode() + b"\n")
+    await wait_for(reader, "draw_round")
+    while module.current_round is None:
+        await asyncio.sleep(0.001)
+    return players, (reader, writer)
+
+async def buffer_points(module, handler, count, batch):
+    # Drawer points the server has parsed but the round loop has not consumed yet
+    players, (reader, writer) = await start_round(module, handler)
+    drawer = module.current_round["drawer"]
+    before = traced()
+    sent = 0
+    while sent < count:
+        lines = []
+        for i in range(sent, min(sent + batch, count)):
+            msg = {"type": "draw", "x": 50 + i % 500, "y": 100 + i % 300, "color": "black", "start_new": i % 500 == 0}
+            lines.append(json.dumps(msg).encode() + b"\n")
+        writer.write(b"".join(lines))
+        sent += len(lines)
+        await asyncio.sleep(0)
+    while drawer.pending_points is None or len(drawer.pending_points) < count:
+        await asyncio.sleep(0.001)
+    return players, (traced() - before) / count
+
+async def connect_players(handler, count):
+    before = traced()
+    players = [await connect_player(handler, f"p{i}") for i in range(count)]
+    return players, (traced() - before) / count
+
+async def run(args, module):
+    if args.server == "tcp":
+        handler = module.ScribbleTCPServer().handle_client
+    else:
+        handler = module.stream_handler_wrapper
+    client_size = bare_clients(module, args.connections)
+    round_players, point_size = await buffer_points(module, handler, args.points, args.batch)
+    start = time.perf_counter()
+    players, player_size = await connect_players(handler, args.connections)
+    connect_time = time.perf_counter() - start
+    players.extend(round_players)
+    total = traced()
+    for _, writer in players:
+        writer.close()
+    await asyncio.sleep(0.1)
+    return {
+        "client": client_size,
+        "player": player_size,
+        "point": point_size,
+        "total": total,
+        "connect_time": connect_time,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure server memory per connected player and per buffered stroke point")
+    parser.add_argument("--server", choices=sorted(SERVERS), default="tcp", help="which server's game core to load")
+    parser.add_argument("--connections", type=int, default=10000, help="players connected over in-memory pipes")
+    parser.add_argument("--points", type=int, default=20000, help="drawer points left queued on one player")
+    parser.add_argument("--batch", type=int, default=200, help="points per drawer write")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        module = load_server(args.server, workdir)
+        module.RECORD_REPLAYS = False
+        # The bench players never read their pings, keep heartbeats out of the measurement
+        module.HEARTBEAT_INTERVAL = 3600
+        module.HEARTBEAT_TIMEOUT = float("inf")
+        # The round loop sleeps once the round is running, so the drawer's points stay queued
+        module.ROUND_TICK = 3600
+        tracemalloc.start()
+        devnull = open(os.devnull, "w")
+        try:
+            with contextlib.redirect_stdout(devnull):
+                stats = asyncio.run(run(args, module))
+        finally:
+            tracemalloc.stop()
+            devnull.close()
+            os.chdir(cwd)
+    print(f"{args.server} server, {args.connections} players over in-memory pipes")
+    print(f"Client object (bytes): {stats['client']:,.0f}")
+    print(f"Connected player, both pipe ends, tasks and buffers included (bytes): {stats['player']:,.0f}")
+    print(f"Queued drawer point (bytes): {stats['point']:,.1f} ({args.points} points on one drawer)")
+    print(f"Traced total (MB): {stats['total'] / 2 ** 20:,.1f}  connect time (s): {stats['connect_time']:.2f}")
+
+if __name__ == "__main__":
+    main()
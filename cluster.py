@@ -0,0 +1,156 @@
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared state for running several server nodes side by side. SQLite stands in for a
+# Redis-style store: the nodes table is the room directory, events is a polled pub/sub bus
+# and scores backs the global leaderboard. Every node opens the same database file.
+NODE_TIMEOUT = 10
+EVENT_TTL = 60
+LEADERBOARD_SIZE = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    node_id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    protocol TEXT NOT NULL,
+    room TEXT,
+    players INTEGER NOT NULL DEFAULT 0,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    node_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scores (
+    room TEXT NOT NULL,
+    name TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    PRIMARY KEY (room, name)
+);
+"""
+
+class Cluster:
+    def __init__(self, path, node_id, host, port, protocol):
+        self.node_id = node_id
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.room = None
+        self.players = None
+        # Every query runs on this one worker thread so a locked database never stalls the event loop
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cluster")
+        self.db = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        # Only events published after we joined are interesting
+        self.last_event = self.db.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        self.db.execute(
+            "INSERT OR REPLACE INTO nodes (node_id, host, port, protocol, room, players, last_seen) VALUES (?, ?, ?, ?, NULL, 0, ?)",
+            (node_id, host, port, protocol, time.time()),
+        )
+
+    def run(self, method, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, method, *args)
+
+    def heartbeat(self, players):
+        self.db.execute("UPDATE nodes SET players = ?, last_seen = ? WHERE node_id = ?", (players, time.time(), self.node_id))
+
+    def live_nodes(self):
+        return self.db.execute(
+            "SELECT * FROM nodes WHERE protocol = ? AND last_seen > ? ORDER BY node_id",
+            (self.protocol, time.time() - NODE_TIMEOUT),
+        ).fetchall()
+
+    def locate(self, room):
+        # Returns the node row that hosts the room, claiming it here or on a free node if nobody does
+        if self.room is None and self.claim(room):
+            return self.db.execute("SELECT * FROM nodes WHERE node_id = ?", (self.node_id,)).fetchone()
+        nodes = self.live_nodes()
+        for node in nodes:
+            if node["room"] == room:
+                return node
+        # The chosen node claims the room itself when the redirected player asks for it
+        return next((node for node in nodes if node["room"] is None), None)
+
+    def claim(self, room):
+        # A single conditional UPDATE, so two nodes racing for the same room cannot both get it
+        cursor = self.db.execute(
+            "UPDATE nodes SET room = ? WHERE node_id = ? AND room IS NULL AND NOT EXISTS "
+            "(SELECT 1 FROM nodes WHERE room = ? AND last_seen > ?)",
+            (room, self.node_id, room, time.time() - NODE_TIMEOUT),
+        )
+        if cursor.rowcount != 1:
+            return False
+        self.room = room
+        self.publish("lobby", {"room": room})
+        return True
+
+    def release(self):
+        if self.room is None:
+            return
+        self.publish("lobby", {"room": self.room, "closed": True})
+        self.room = None
+        self.db.execute("UPDATE nodes SET room = NULL WHERE node_id = ?", (self.node_id,))
+
+    def sync(self, players, idle):
+        # One cluster_loop tick: refresh our entry, give up an empty room and collect updates for local players
+        self.heartbeat(players)
+        if players != self.players:
+            self.players = players
+            self.publish("lobby", {"room": self.room, "players": players})
+        if self.room is not None and idle:
+            self.release()
+        topics = {topic for _, topic, _ in self.poll()}
+        updates = []
+        if "lobby" in topics:
+            updates.append({"type": "lobby", "rooms": self.lobby()})
+        if "scores" in topics:
+            updates.append({"type": "leaderboard", "top": self.leaderboard()})
+        return updates
+
+    def leave(self):
+        self.executor.shutdown()
+        self.release()
+        self.db.execute("DELETE FROM nodes WHERE node_id = ?", (self.node_id,))
+        self.db.close()
+
+    def publish(self, topic, payload):
+        now = time.time()
+        self.db.execute(
+            "INSERT INTO events (node_id, topic, payload, created) VALUES (?, ?, ?, ?)",
+            (self.node_id, topic, json.dumps(payload), now),
+        )
+        self.db.execute("DELETE FROM events WHERE created < ?", (now - EVENT_TTL,))
+
+    def poll(self):
+        rows = self.db.execute(
+            "SELECT id, node_id, topic, payload FROM events WHERE id > ? ORDER BY id", (self.last_event,)
+        ).fetchall()
+        if rows:
+            self.last_event = rows[-1]["id"]
+        return [(row["node_id"], row["topic"], json.loads(row["payload"])) for row in rows]
+
+    def record_scores(self, scores):
+        room = self.room or self.node_id
+        self.db.executemany(
+            "INSERT OR REPLACE INTO scores (room, name, score) VALUES (?, ?, ?)",
+            [(room, name, score) for name, score in scores.items() if name],
+        )
+        self.publish("scores", {"room": room})
+
+    def lobby(self):
+        return {node["room"]: node["players"] for node in self.live_nodes() if node["room"] is not None}
+
+    def leaderboard(self):
+        rows = self.db.execute(
+            "SELECT name, room, score FROM scores ORDER BY score DESC, name LIMIT ?", (LEADERBOARD_SIZE,)
+        ).fetchall()
+        return [[row["name"], row["room"], row["score"]] for row in rows]
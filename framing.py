@@ -0,0 +1,44 @@
+import asyncio
+import zlib
+
+# Wire framing shared by the servers and clients. A frame is either a plain JSON line or a
+# zero byte, a 4-byte length and a raw deflate payload of JSON lines.
+COMPRESS_LEVEL = 6
+COMPRESS_MIN_SIZE = 100
+# Preset dictionary for zlib, hand-built from the message templates the servers send.
+# The most frequent fragments (stroke points) go last, where deflate finds them cheapest.
+ZDICT = (
+    b'{"type": "resumed", "name": "", "score": 0, "ready": true, "round": {"role": "guess", "length": , "remaining": }, "canvas": [['
+    b'{"type": "spectate", "round": {"drawer": "'
+    b'{"type": "guess_round", "length": 5, "message": "Round started! Word length: 5"}\n'
+    b'{"type": "round_end", "message": " guessed correctly: !", "scores": {"": 10, "": 5, "": 0}}\n'
+    b'{"type": "round_end", "message": "Time\'s up! The word was: ", "scores": {'
+    b'{"type": "status", "message": "'
+    b'{"type": "erase", "ids": [, '
+    b', "black"], [, "red"], [, "blue"], [, "green"], ['
+    b'{"type": "draw", "x": 1, "y": 1, "color": "blue", "start_new": true}\n'
+    b'{"type": "draw", "x": 1, "y": 1, "color": "green", "start_new": false, "id": 1}\n'
+    b'{"type": "draw", "x": 1, "y": 1, "color": "red", "start_new": false, "id": 1}\n'
+    b'{"type": "draw", "x": 1, "y": 1, "color": "black", "start_new": false, "id": 1}\n'
+)
+
+def pack_frame(data):
+    # Compressed frames start with a zero byte and a 4-byte length so they never look like a JSON line
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -15, zdict=ZDICT)
+    payload = compressor.compress(data) + compressor.flush()
+    if len(payload) + 5 >= len(data):
+        return data
+    return b"\x00" + len(payload).to_bytes(4, "big") + payload
+
+async def read_frame(reader):
+    # Returns b"" when the stream ends or a payload does not inflate, callers treat both as a lost connection
+    try:
+        first = await reader.readexactly(1)
+        if first != b"\x00":
+            return first + await reader.readline()
+        size = int.from_bytes(await reader.readexactly(4), "big")
+        payload = await reader.readexactly(size)
+        decompressor = zlib.decompressobj(-15, zdict=ZDICT)
+        return decompressor.decompress(payload) + decompressor.flush()
+    except (asyncio.IncompleteReadError, zlib.error):
+        return b""
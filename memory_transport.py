@@ -0,0 +1,71 @@
+import asyncio
+import itertools
+
+# In-process stand-in for a socket: both ends are ordinary asyncio StreamReader/StreamWriter
+# pairs, so the servers' handle_client runs unmodified without any network underneath.
+_connection_ids = itertools.count(1)
+
+class MemoryTransport(asyncio.Transport):
+    def __init__(self, protocol, extra=None):
+        super().__init__(extra)
+        self.protocol = protocol
+        self.peer = None
+        self._closing = False
+        self._reading = True
+        self.bytes_written = 0
+
+    def write(self, data):
+        # Like a socket transport, writes after close are silently dropped
+        if self._closing or not data:
+            return
+        self.bytes_written += len(data)
+        self.peer.protocol.data_received(bytes(data))
+
+    def can_write_eof(self):
+        return False
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def get_write_buffer_limits(self):
+        return (0, 0)
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        pass
+
+    def is_reading(self):
+        return self._reading
+
+    def pause_reading(self):
+        self._reading = False
+
+    def resume_reading(self):
+        self._reading = True
+
+    def is_closing(self):
+        return self._closing
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        asyncio.get_running_loop().call_soon(self.protocol.connection_lost, None)
+        self.peer.close()
+
+    def abort(self):
+        self.close()
+
+async def open_connection(handler, limit=2 ** 16):
+    # Same contract as asyncio.open_connection, with handler(reader, writer) playing the server
+    loop = asyncio.get_running_loop()
+    extra = {"peername": ("memory", next(_connection_ids)), "socket": None}
+    client_reader = asyncio.StreamReader(limit=limit, loop=loop)
+    client_protocol = asyncio.StreamReaderProtocol(client_reader, loop=loop)
+    server_protocol = asyncio.StreamReaderProtocol(asyncio.StreamReader(limit=limit, loop=loop), handler, loop=loop)
+    client_transport = MemoryTransport(client_protocol, extra)
+    server_transport = MemoryTransport(server_protocol, extra)
+    client_transport.peer = server_transport
+    server_transport.peer = client_transport
+    server_protocol.connection_made(server_transport)
+    client_protocol.connection_made(client_transport)
+    return client_reader, asyncio.StreamWriter(client_transport, client_protocol, client_reader, loop)
@@ -1,24 +1,63 @@
+import time
+# Taken before anything else is imported so the startup timings cover the whole launch
+STARTED = time.perf_counter()
 import asyncio
 import tkinter as tk
-from tkinter import messagebox
-from aioquic.asyncio import connect
-from aioquic.quic.configuration import QuicConfiguration
 import threading
 import json
-import time
+import pickle
+from collections import deque
 import logging
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from framing import read_frame
+from scribble import ERASE_RADIUS, CanvasIndex, RateController, decimate, quic_congested
 
 logging.basicConfig(level=logging.DEBUG)
 
 SERVER_HOST = "localhost"
 SERVER_PORT = 4433
+CA_FILE = "../server_cert.pem"
+# Tickets survive restarts so the first connection of a new session can resume and send 0-RTT data
+SESSION_TICKET_FILE = "quic_session_tickets.pickle"
+HEARTBEAT_TIMEOUT = 15
+RECONNECT_DELAY = 1
+RECONNECT_ATTEMPTS = 30
+# Adaptive stroke sending, points are batched and thinned while the connection is congested
+BATCH_INTERVAL = 0.02
+MAX_BATCH_INTERVAL = 0.3
+MAX_TOLERANCE = 6.0
+
+def load_session_tickets():
+    try:
+        with open(SESSION_TICKET_FILE, "rb") as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return {}
 
 class ScribbleClientGUI:
-    def __init__(self, root):
+    def __init__(self):
+        # Connection state only, the network thread starts on it while Tk is still coming up
         self.loop = None
+        self.username = None
+        self.session_token = None
+        self.host = SERVER_HOST
+        self.port = SERVER_PORT
+        self.room = None
+        self.redirected = False
+        self.rooms = {}
+        self.leaders = []
+        self.session_tickets = {}
+        self.outgoing = deque()
+        self.rate = RateController(BATCH_INTERVAL, 0.0, MAX_BATCH_INTERVAL, MAX_TOLERANCE)
+        self.writer = None
+        self.ui_ready = threading.Event()
+        self.startup = {}
+
+    def build_ui(self, root):
         self.root = root
         self.root.title("Scribble Game Client")
-        self.username = None
         self.last_draw_time = None
         self.current_color = "black"
         self.erase_mode = False
@@ -27,6 +66,9 @@ class ScribbleClientGUI:
         tk.Label(self.username_frame, text="Username:").pack(side=tk.LEFT)
         self.username_entry = tk.Entry(self.username_frame)
         self.username_entry.pack(side=tk.LEFT, padx=5)
+        tk.Label(self.username_frame, text="Room:").pack(side=tk.LEFT)
+        self.room_entry = tk.Entry(self.username_frame, width=10)
+        self.room_entry.pack(side=tk.LEFT, padx=5)
         self.set_username_button = tk.Button(self.username_frame, text="Set Username", command=self.set_username)
         self.set_username_button.pack(side=tk.LEFT)
         self.tools_frame = tk.Frame(root)
@@ -37,6 +79,11 @@ class ScribbleClientGUI:
         self.is_drawer = False
         self.last_x = None
         self.last_y = None
+        self.index = CanvasIndex()
+        self.remote_items = {}
+        # Our own sent points (x, y, raw canvas line) until the server echoes them back
+        self.provisional = deque()
+        self.echo_last = None
         self.color_buttons = {}
         colors = [("Black", "black"), ("Red", "red"), ("Blue", "blue"), ("Green", "green")]
         for label, color in colors:
@@ -54,10 +101,33 @@ class ScribbleClientGUI:
         self.guess_button.pack(side=tk.LEFT, padx=5)
         self.ready_button = tk.Button(root, text="I'm Ready", command=self.send_ready, state="disabled")
         self.ready_button.pack(pady=5)
+        self.spectate_button = tk.Button(root, text="Spectate", command=self.send_spectate)
+        self.spectate_button.pack(pady=5)
+        self.is_spectator = False
         self.status = tk.Label(root, text="Not connected")
         self.status.pack()
+        self.lobby_label = tk.Label(root, text="")
+        self.lobby_label.pack()
         self.word_buttons = []
-        self.writer = None
+        self.root.bind("<Expose>", self.first_frame)
+        self.ui_ready.set()
+
+    def first_frame(self, event):
+        self.root.unbind("<Expose>")
+        self.mark_startup("first_frame")
+
+    def mark_startup(self, milestone):
+        # Time since launch of the first frame, the QUIC handshake and the first server reply
+        if milestone in self.startup:
+            return
+        self.startup[milestone] = (time.perf_counter() - STARTED) * 1000
+        print(f"Startup: {milestone} after {self.startup[milestone]:.1f}ms")
+        if len(self.startup) == 3:
+            print("Startup: first frame {first_frame:.1f}ms, connected {connected:.1f}ms, first reply {first_reply:.1f}ms".format(**self.startup))
+
+    async def wait_for_ui(self):
+        if not self.ui_ready.is_set():
+            await self.loop.run_in_executor(None, self.ui_ready.wait)
 
     def set_username(self):
         username = self.username_entry.get().strip()
@@ -66,13 +136,24 @@ class ScribbleClientGUI:
             self.status.config(text=f"Username set: {username}")
             self.ready_button.config(state="normal")
             self.username_entry.config(state="disabled")
+            self.room_entry.config(state="disabled")
             self.set_username_button.config(state="disabled")
+            self.room = self.room_entry.get().strip() or None
             if self.writer and self.loop:
-                self.writer.write(f"USERNAME:{username}\n".encode())
+                if self.room:
+                    # The username follows once the server confirms it hosts the room
+                    self.writer.write(f"ROOM:{self.room}\n".encode())
+                else:
+                    self.writer.write(f"USERNAME:{username}\n".encode())
                 asyncio.run_coroutine_threadsafe(self.writer.drain(), self.loop)
         else:
             self.status.config(text="Please enter a valid username")
             
+    def update_lobby(self):
+        rooms = ", ".join(f"{room} ({count})" for room, count in sorted(self.rooms.items()))
+        leaders = ", ".join(f"{name} {score}" for name, _, score in self.leaders[:3])
+        self.lobby_label.config(text=f"Rooms: {rooms or '-'}   Top: {leaders or '-'}")
+
     def set_color(self, color):
         self.current_color = color
         for c, btn in self.color_buttons.items():
@@ -93,31 +174,43 @@ class ScribbleClientGUI:
         current_time = time.time()
         x, y = event.x, event.y
         if self.erase_mode:
-            if self.writer and self.loop:
-                msg = json.dumps({"type": "erase", "x": x, "y": y})
-                self.writer.write(f"{msg}\n".encode())
-                asyncio.run_coroutine_threadsafe(self.writer.drain(), self.loop)
-            self.canvas.create_rectangle(x-2, y-2, x+2, y+2, fill="white", outline="white")
+            # The server decides what goes, on the simplified segments everyone sees, and sends the
+            # ids back to us as well. The local hit-test only skips erases that cannot hit anything.
+            if self.index.hits(x, y, ERASE_RADIUS) and self.writer and self.loop:
+                # Queued behind the pending points so the server erases what we drew
+                self.outgoing.append({"type": "erase", "x": x, "y": y})
         else:
             if self.last_draw_time is not None and (current_time - self.last_draw_time) > 0.1:
                 self.last_x = None
                 self.last_y = None
-            if self.last_x is not None:
-                self.canvas.create_line(self.last_x, self.last_y, x, y, fill=self.current_color, width=3)
+            start_new = self.last_x is None
+            item = None
+            if not start_new:
+                item = self.add_line(self.last_x, self.last_y, x, y, self.current_color)
             self.last_draw_time = current_time
             self.last_x, self.last_y = x, y
             if self.writer and self.loop:
-                msg = json.dumps({"type": "draw", "x": x, "y": y, "color": self.current_color})
-                self.writer.write(f"{msg}\n".encode())
-                asyncio.run_coroutine_threadsafe(self.writer.drain(), self.loop)
+                self.provisional.append((x, y, item))
+                self.outgoing.append({"type": "draw", "x": x, "y": y, "color": self.current_color, "start_new": start_new})
 
     def send_ready(self):
         if self.writer and self.loop and self.username:
             self.writer.write(b"READY\n")
             asyncio.run_coroutine_threadsafe(self.writer.drain(), self.loop)
+            self.is_spectator = False
+            self.spectate_button.config(state="disabled")
             self.status.config(text="Sent READY")
             self.ready_button.config(state="disabled")
 
+    def send_spectate(self):
+        if self.writer and self.loop:
+            self.writer.write(b"SPECTATE\n")
+            asyncio.run_coroutine_threadsafe(self.writer.drain(), self.loop)
+            self.is_spectator = True
+            self.status.config(text="Spectating")
+            self.spectate_button.config(state="disabled")
+            self.guess_frame.pack_forget()
+
     def send_guess(self):
         guess = self.guess_entry.get().strip()
         if guess and self.writer and self.loop:
@@ -137,21 +230,85 @@ class ScribbleClientGUI:
 
     def clear_canvas(self):
         self.canvas.delete("all")
+        self.index = CanvasIndex()
+        self.remote_items = {}
+        self.provisional.clear()
+        self.echo_last = None
         self.last_x = None
         self.last_y = None
         self.last_draw_time = None
 
+    def add_line(self, x1, y1, x2, y2, color, remote_id=None):
+        item = self.canvas.create_line(x1, y1, x2, y2, fill=color, width=3)
+        self.index.add(x1, y1, x2, y2, color, seg_id=item)
+        if remote_id is not None:
+            self.remote_items[remote_id] = item
+        return item
+
+    def render_draw(self, msg):
+        x, y = msg["x"], msg["y"]
+        color = msg.get("color", "black")
+        if msg.get("start_new", False):
+            self.last_x = None
+            self.last_y = None
+        if self.last_x is not None:
+            self.add_line(self.last_x, self.last_y, x, y, color, msg.get("id"))
+        self.last_x, self.last_y = x, y
+
+    def confirm_draw(self, msg):
+        # Our own stroke as the server simplified and numbered it. The raw lines up to this point
+        # are swapped for the segment the guessers got, so erases hit the same lines everywhere.
+        x, y = msg["x"], msg["y"]
+        sent = list(self.provisional)
+        end = next((i for i, (px, py, _) in enumerate(sent) if (px, py) == (x, y)), None)
+        if end is not None:
+            for _ in range(end + 1):
+                _, _, item = self.provisional.popleft()
+                if item is not None:
+                    self.canvas.delete(item)
+                    self.index.remove(item)
+        if msg.get("start_new", False):
+            self.echo_last = None
+        if self.echo_last is not None:
+            self.add_line(*self.echo_last, x, y, msg.get("color", "black"), msg.get("id"))
+        self.echo_last = (x, y)
+
+    def render_erase(self, msg):
+        for remote_id in msg["ids"]:
+            item = self.remote_items.pop(remote_id, None)
+            if item is not None:
+                self.canvas.delete(item)
+                self.index.remove(item)
+
+    def save_session_ticket(self, ticket):
+        # Reused on reconnect and on the next launch so the TLS handshake resumes instead of starting over
+        self.session_tickets[f"{self.host}:{self.port}"] = ticket
+        try:
+            with open(SESSION_TICKET_FILE, "wb") as f:
+                pickle.dump(self.session_tickets, f)
+        except OSError as e:
+            print(f"Could not save session ticket: {e}")
+
     async def listen_server(self, reader):
         while True:
-            data = await reader.read(1024)
+            try:
+                data = await asyncio.wait_for(read_frame(reader), HEARTBEAT_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.status.config(text="Connection lost")
+                break
             if not data:
+                self.status.config(text="Connection lost")
                 break
+            self.mark_startup("first_reply")
             messages = data.decode().strip().split("\n")
             for message in messages:
                 try:
                     msg = json.loads(message)
                     msg_type = msg.get("type")
-                    if msg_type == "status":
+                    if msg_type == "ping":
+                        self.writer.write(b"PONG\n")
+                        await self.writer.drain()
+                    elif msg_type == "status":
                         self.status.config(text=msg["message"])
                     elif msg_type == "word_options":
                         self.is_drawer = True
@@ -174,58 +331,165 @@ class ScribbleClientGUI:
                         self.is_drawer = False
                         self.clear_canvas()
                         self.status.config(text=msg["message"])
-                        self.guess_frame.pack()
+                        if not self.is_spectator:
+                            self.guess_frame.pack()
 
                     elif msg_type == "draw":
-                        if not self.is_drawer:
-                            x, y = msg["x"], msg["y"]
-                            color = msg.get("color", "black")
-                            start_new = msg.get("start_new", False)
-                            if start_new:
-                                self.last_x = None
-                                self.last_y = None
-                            if self.last_x is not None:
-                                self.canvas.create_line(self.last_x, self.last_y, x, y, fill=color, width=3)
-                            self.last_x, self.last_y = x, y
+                        if self.is_drawer:
+                            self.confirm_draw(msg)
+                        else:
+                            self.render_draw(msg)
                     elif msg_type == "erase":
-                        if not self.is_drawer:
-                            x, y = msg["x"], msg["y"]
-                            self.canvas.create_rectangle(x-2, y-2, x+2, y+2, fill="white", outline="white")
+                        self.render_erase(msg)
+                    elif msg_type == "compress":
+                        pass
+                    elif msg_type == "room":
+                        if self.username and not self.session_token:
+                            self.writer.write(f"USERNAME:{self.username}\n".encode())
+                            await self.writer.drain()
+                        self.status.config(text=f"Joined room {msg['name']}")
+                    elif msg_type == "redirect":
+                        # Another node hosts this room, reconnect there and ask again
+                        self.host, self.port = msg["host"], msg["port"]
+                        self.redirected = True
+                        self.status.config(text=f"Room {msg['room']} is on {self.host}:{self.port}, moving...")
+                        return
+                    elif msg_type == "lobby":
+                        self.rooms = msg["rooms"]
+                        self.update_lobby()
+                    elif msg_type == "leaderboard":
+                        self.leaders = msg["top"]
+                        self.update_lobby()
+                    elif msg_type == "session":
+                        self.session_token = msg["token"]
+                    elif msg_type == "resumed":
+                        self.username = msg["name"]
+                        self.clear_canvas()
+                        for btn in self.word_buttons:
+                            btn.destroy()
+                        self.word_buttons = []
+                        round_info = msg["round"]
+                        self.is_drawer = round_info is not None and round_info["role"] == "draw"
+                        for remote_id, x1, y1, x2, y2, color in msg["canvas"]:
+                            self.add_line(x1, y1, x2, y2, color, remote_id)
+                        if round_info:
+                            self.status.config(text=f"Reconnected! {round_info['remaining']}s left in this round.")
+                        else:
+                            self.status.config(text=f"Reconnected as {self.username}. Score: {msg['score']}")
+                        if self.is_drawer:
+                            self.guess_frame.pack_forget()
+                        else:
+                            self.guess_frame.pack()
+                        self.ready_button.config(state="disabled" if msg["ready"] else "normal")
+                    elif msg_type == "spectate":
+                        self.is_drawer = False
+                        self.clear_canvas()
+                        for remote_id, x1, y1, x2, y2, color in msg["canvas"]:
+                            self.add_line(x1, y1, x2, y2, color, remote_id)
+                        round_info = msg["round"]
+                        if round_info:
+                            self.status.config(text=f"Spectating: {round_info['drawer']} is drawing a {round_info['length']} letter word ({round_info['remaining']}s left)")
+                        else:
+                            self.status.config(text="Spectating, waiting for the next round")
+                    elif msg_type == "resume_failed":
+                        self.session_token = None
+                        self.username = None
+                        self.status.config(text=msg["message"])
+                        self.username_entry.config(state="normal")
+                        self.set_username_button.config(state="normal")
+                        self.ready_button.config(state="disabled")
                     elif msg_type == "round_end":
                         self.is_drawer = False
                         self.status.config(text=msg["message"])
                         scores = msg["scores"]
                         score_text = "\n".join([f"{name}: {score}" for name, score in scores.items()])
-                        messagebox.showinfo("Round End", f"{msg['message']}\n\nScores:\n{score_text}")
+                        from tkinter import messagebox
+                        self.root.after(0, messagebox.showinfo, "Round End", f"{msg['message']}\n\nScores:\n{score_text}")
                         self.clear_canvas()
-                        self.guess_frame.pack()
+                        if not self.is_spectator:
+                            self.guess_frame.pack()
                         for btn in self.word_buttons:
                             btn.destroy()
                         self.word_buttons = []
                 except json.JSONDecodeError:
                     print(f"Invalid JSON: {message}")
 
+    async def send_strokes(self, writer):
+        # Sends queued drawer events in batches, thinning points while QUIC reports congestion
+        while True:
+            await asyncio.sleep(self.rate.interval)
+            if not self.outgoing:
+                continue
+            messages = []
+            while self.outgoing:
+                messages.append(self.outgoing.popleft())
+            writer.writelines([json.dumps(msg).encode() + b"\n" for msg in decimate(messages, self.rate.tolerance)])
+            self.rate.update(quic_congested(writer))
+
     async def start_quic(self):
         self.loop = asyncio.get_running_loop()
+        # aioquic and its crypto backend are the slowest imports, they load here while Tk builds the window
+        from aioquic.asyncio import connect
+        from aioquic.quic.configuration import QuicConfiguration
         configuration = QuicConfiguration(
             alpn_protocols=["scribble"],
             is_client=True,
-            server_name=SERVER_HOST,    
+            server_name=SERVER_HOST,
+            idle_timeout=HEARTBEAT_TIMEOUT,
         )
-        configuration.load_verify_locations("../server_cert.pem")
-        async with connect(SERVER_HOST, SERVER_PORT, configuration=configuration) as protocol:
-            reader, writer = await protocol.create_stream()
-            self.writer = writer
-            print(time.time())
-            self.status.config(text="Connected to server")
-            await self.listen_server(reader)
+        configuration.load_verify_locations(CA_FILE)
+        self.session_tickets = load_session_tickets()
+        attempts = 0
+        while attempts <= RECONNECT_ATTEMPTS:
+            configuration.session_ticket = self.session_tickets.get(f"{self.host}:{self.port}")
+            try:
+                # Without waiting for the handshake the first lines go out as 0-RTT data when a ticket allows it
+                async with connect(self.host, self.port, configuration=configuration, session_ticket_handler=self.save_session_ticket,
+                                   wait_connected=False) as protocol:
+                    reader, writer = await protocol.create_stream()
+                    writer.write(b"COMPRESS:zlib\n")
+                    if self.session_token:
+                        # Server answers with the whole player and canvas state in one message
+                        writer.write(f"RESUME:{self.session_token}\n".encode())
+                    if self.room:
+                        writer.write(f"ROOM:{self.room}\n".encode())
+                    elif self.username and not self.session_token:
+                        # Set while we were still connecting or reconnecting, the server has not heard it yet
+                        writer.write(f"USERNAME:{self.username}\n".encode())
+                    await protocol.wait_connected()
+                    self.mark_startup("connected")
+                    tls = protocol._quic.tls
+                    print(f"Handshake {'resumed' if tls.session_resumed else 'full'}, 0-RTT {'accepted' if tls.early_data_accepted else 'not used'}")
+                    await self.wait_for_ui()
+                    self.writer = writer
+                    attempts = 0
+                    self.status.config(text="Connected to server")
+                    self.outgoing.clear()
+                    sender = asyncio.create_task(self.send_strokes(writer))
+                    try:
+                        await self.listen_server(reader)
+                    finally:
+                        sender.cancel()
+            except ConnectionError as e:
+                await self.wait_for_ui()
+                self.status.config(text=f"Connection Error: {e}")
+            self.writer = None
+            if self.redirected:
+                self.redirected = False
+                continue
+            attempts += 1
+            if attempts <= RECONNECT_ATTEMPTS:
+                self.status.config(text=f"Reconnecting ({attempts}/{RECONNECT_ATTEMPTS})...")
+                await asyncio.sleep(RECONNECT_DELAY)
 
 def run_gui():
-    root = tk.Tk()
-    app = ScribbleClientGUI(root)
+    # The connection starts first, the handshake runs while Tk opens the display and builds the window
+    app = ScribbleClientGUI()
     def run_asyncio():
         asyncio.run(app.start_quic())
     threading.Thread(target=run_asyncio, daemon=True).start()
+    root = tk.Tk()
+    app.build_ui(root)
     root.mainloop()
 if __name__ == "__main__":
     run_gui()
\ No newline at end of file
@@ -1,22 +1,81 @@
 import asyncio
 import json
+import os
 import random
+import secrets
+import sys
 import time
-from aioquic.asyncio import serve
+from array import array
+from types import MappingProxyType
+from collections import deque
+from aioquic.asyncio.server import QuicServer
+from aioquic.buffer import Buffer
 from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.packet import pull_quic_header
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from cluster import Cluster
+from framing import COMPRESS_MIN_SIZE, pack_frame
+from scribble import ERASE_RADIUS, CanvasIndex, RateController, ReplayLog, SpectatorFeed, StrokeBuffer, quic_backlog, quic_congested, simplify_points
 clients = []
 ready_clients = set()
+sessions = {}
+game_running = False
+current_round = None
+node = None
+metrics_file = None
+session_tickets = {}
 words_list = []
 events=None
 
 ADDRESS="127.0.0.1"
-PORT=4433
+PORT=int(os.environ.get("SCRIBBLE_PORT", 4433))
+# Cluster mode: every node pointed at the same SQLite file shares one room directory
+CLUSTER_DB = os.environ.get("SCRIBBLE_CLUSTER_DB")
+PUBLIC_HOST = os.environ.get("SCRIBBLE_PUBLIC_HOST", ADDRESS)
+CLUSTER_INTERVAL = 1
+# An ECDSA P-256 or Ed25519 certificate signs handshakes far faster than RSA-2048 (see README)
+CERT_FILE = "../server_cert.pem"
+KEY_FILE = "../server_key.pem"
+HANDSHAKES_PER_TICK = 4
+HANDSHAKE_BACKLOG = 1024
+HEARTBEAT_INTERVAL = 5
+HEARTBEAT_TIMEOUT = 15
+SEND_TIMEOUT = 5
+SESSION_GRACE = 30
+# How often the round loop forwards strokes and checks guesses
+ROUND_TICK = 0.01
+# Tickets are single-use, anything past this many or past its lifetime is forgotten
+MAX_SESSION_TICKETS = 10000
+# Stroke simplification before fan-out, tolerance in pixels (0 forwards raw points)
+SIMPLIFY_TOLERANCE = 1.0
+SIMPLIFY_WINDOW = 8
+SIMPLIFY_DELAY = 0.05
+# Adaptive stroke rate, the room backs off while any guesser's link is congested
+MAX_SIMPLIFY_DELAY = 0.4
+MAX_SIMPLIFY_TOLERANCE = 6.0
+RECORD_REPLAYS = True
+REPLAY_DIR = "../replays"
+# Forwarded points are formatted straight into the same JSON json.dumps would produce
+STROKE_START = '{"type": "draw", "x": %d, "y": %d, "color": %s, "start_new": true}'
+STROKE_POINT = '{"type": "draw", "x": %d, "y": %d, "color": %s, "start_new": false, "id": %d}'
 
 # Load words from file
 with open("words.txt", "r") as f:
     words_list = [line.strip() for line in f if line.strip()]
 
+NO_MESSAGE = MappingProxyType({})
+
+spectator_feed = SpectatorFeed()
+
 class Client:
+    # Slots instead of a per-instance dict, rooms can hold thousands of these
+    __slots__ = (
+        "writer", "reader", "ready", "name", "score", "_last_json", "last_draw_time", "last_x", "last_y",
+        "bytes_received", "start_time", "connection_time", "alive", "last_seen", "token", "expired", "expiry",
+        "pending_points", "stroke_window", "stroke_color", "window_started", "points_in", "points_out",
+        "spectator", "compress",
+    )
+
     def __init__(self, writer, reader, addr):
         self.writer = writer
         self.reader = reader
@@ -24,18 +83,77 @@ class Client:
         self.ready = False
         self.name = None
         self.score = 0
-        self._last_json = {}
+        self._last_json = NO_MESSAGE
         self.last_draw_time = None
         self.last_x = None
         self.last_y = None
         self.bytes_received = 0
         self.start_time = time.time()
         self.connection_time = self.start_time
+        self.alive = True
+        self.last_seen = self.start_time
+        self.token = None
+        self.expired = False
+        self.expiry = None
+        # Created on the first draw point and kept for the round, most players never draw
+        self.pending_points = None
+        # Interleaved x, y of the window being simplified, reused for every window
+        self.stroke_window = None
+        self.stroke_color = None
+        self.window_started = None
+        self.points_in = 0
+        self.points_out = 0
+        self.spectator = False
+        self.compress = False
+
+    def attach(self, writer, reader, addr):
+        self.writer = writer
+        self.reader = reader
+        # self.addr = addr
+        self.alive = True
+        self.last_seen = time.time()
+        if self.expiry:
+            self.expiry.cancel()
+            self.expiry = None
 
     async def send_json(self, obj):
-        data = json.dumps(obj).encode() + b"\n"
+        await self.send_data(json.dumps(obj).encode() + b"\n")
+
+    async def send_data(self, data, packed=None):
+        if not self.alive:
+            return
+        if self.compress and len(data) >= COMPRESS_MIN_SIZE:
+            data = packed or pack_frame(data)
+        try:
+            self.writer.write(data)
+            await asyncio.wait_for(self.writer.drain(), SEND_TIMEOUT)
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            print(f"Send to {self.name} failed: {e!r}")
+            self.close()
+
+    def congested(self):
+        return quic_congested(self.writer)
+
+    def queue(self, data):
         self.writer.write(data)
-        await self.writer.drain()
+
+    def backlog(self):
+        return quic_backlog(self.writer)
+
+    def close(self):
+        # Drop everything we buffered for this player so a dead peer costs nothing
+        if not self.alive:
+            return
+        self.alive = False
+        self._last_json = NO_MESSAGE
+        self.pending_points = None
+        self.stroke_window = None
+        self.last_x = None
+        self.last_y = None
+        try:
+            self.writer.transport.protocol.close()
+        except Exception:
+            pass
 
     async def receive_json(self):
         line = await self.reader.readline()
@@ -45,8 +163,13 @@ class Client:
 
 class ScribbleQUICServer:
     def __init__(self):
-        self.log_file = open("../metrics/quic_metrics.txt", "w")
-        self.log_file.write("Timestamp, Event, BytesReceived, Throughput_Mbps, ConnectionTime_ms\n")
+        # One of these is made per stream, they share the metrics file instead of each opening
+        # (and truncating) their own
+        global metrics_file
+        if metrics_file is None:
+            metrics_file = open("../metrics/quic_metrics.txt", "w")
+            metrics_file.write("Timestamp, Event, BytesReceived, Throughput_Mbps, ConnectionTime_ms\n")
+        self.log_file = metrics_file
         self.start_time = time.time()
         
     def log_metrics(self, client, event, connection_time=None):
@@ -59,70 +182,316 @@ class ScribbleQUICServer:
         self.log_file.flush()
         
     async def handle_client(self, reader, writer):
+        global game_running
         addr = writer.get_extra_info("peername")
         client = Client(writer, reader, addr)
         clients.append(client)
         print(f"Client connected: {addr}")
         self.log_metrics(client, "connect")
 
+        heartbeat_task = asyncio.create_task(self.heartbeat(client))
         try:
-            while True:
-                msg = await reader.readline()
+            while client.alive:
+                try:
+                    msg = await asyncio.wait_for(reader.readline(), HEARTBEAT_TIMEOUT)
+                except asyncio.TimeoutError:
+                    print(f"Client {addr} idle for {HEARTBEAT_TIMEOUT}s, evicting")
+                    break
                 if not msg:
                     break
+                client.last_seen = time.time()
                 client.bytes_received += len(msg)
                 msg = msg.decode().strip()
+                if msg == "PONG":
+                    continue
                 print(f"Received from {addr}: {msg}")
 
                 if msg.startswith("USERNAME:"):
                     username = msg[len("USERNAME:"):].strip()
                     client.name = username
                     print(f"Client {addr} set username: {username}")
+                    if client.token is None:
+                        client.token = secrets.token_urlsafe(16)
+                        sessions[client.token] = client
+                    await client.send_json({"type": "session", "token": client.token})
                     await client.send_json({"type": "status", "message": f"Username set to {username}. Press 'I'm Ready' to join."})
 
+                elif msg.startswith("COMPRESS:"):
+                    offered = [algo.strip() for algo in msg[len("COMPRESS:"):].split(",")]
+                    client.compress = "zlib" in offered
+                    await client.send_json({"type": "compress", "algo": "zlib" if client.compress else None})
+
+                elif msg.startswith("ROOM:"):
+                    room = msg[len("ROOM:"):].strip()
+                    if node is None:
+                        await client.send_json({"type": "room", "name": room})
+                        continue
+                    target = await node.run(node.locate, room)
+                    if target is None:
+                        await client.send_json({"type": "status", "message": f"No free server for room {room}, try again later."})
+                    elif target["node_id"] != node.node_id:
+                        print(f"Redirecting {addr} to {target['host']}:{target['port']} for room {room}")
+                        await client.send_json({"type": "redirect", "room": room, "host": target["host"], "port": target["port"]})
+                    else:
+                        await client.send_json({"type": "room", "name": room})
+                        await client.send_json({"type": "lobby", "rooms": await node.run(node.lobby)})
+                        await client.send_json({"type": "leaderboard", "top": await node.run(node.leaderboard)})
+
+                elif msg.startswith("RESUME:"):
+                    session = sessions.get(msg[len("RESUME:"):].strip())
+                    if session is None:
+                        await client.send_json({"type": "resume_failed", "message": "Session expired, please set your username again."})
+                        continue
+                    # A connection that named itself or already resumed keeps that session
+                    if client.token is not None:
+                        await client.send_json({"type": "resume_failed", "message": "This connection already has a session."})
+                        continue
+                    # The old connection may still look alive if it died silently
+                    session.close()
+                    heartbeat_task.cancel()
+                    # Retire the temporary client without closing the connection the session takes over
+                    client.alive = False
+                    clients.remove(client)
+                    spectator_feed.discard(client)
+                    session.attach(writer, reader, addr)
+                    session.bytes_received += client.bytes_received
+                    session.compress = client.compress
+                    client = session
+                    # Still listed when the old connection has not noticed it is dead yet
+                    if client not in clients:
+                        clients.append(client)
+                    if client.ready:
+                        ready_clients.add(client)
+                    heartbeat_task = asyncio.create_task(self.heartbeat(client))
+                    print(f"Client {addr} resumed session of {client.name}")
+                    self.log_metrics(client, "resume")
+                    await client.send_json(self.resume_state(client))
+
+                elif msg == "SPECTATE":
+                    if current_round and client in current_round["players"]:
+                        await client.send_json({"type": "status", "message": "You are in this game, you can spectate once it is over."})
+                        continue
+                    client.spectator = True
+                    # A spectator no longer counts towards starting the game
+                    client.ready = False
+                    ready_clients.discard(client)
+                    # The snapshot below already holds everything still pending, send that to the others first
+                    spectator_feed.flush()
+                    spectator_feed.add(client)
+                    self.log_metrics(client, "spectate")
+                    await client.send_json(self.spectate_state())
+                    print(f"Client {addr} is spectating ({len(spectator_feed.spectators)} spectators)")
+
                 elif msg == "READY":
                     if not client.name:
                         await client.send_json({"type": "status", "message": "Please set a username first."})
                         continue
+                    if client.spectator:
+                        client.spectator = False
+                        spectator_feed.discard(client)
                     client.ready = True
                     ready_clients.add(client)
                     await client.send_json({"type": "status", "message": "Waiting for other players..."})
                     self.log_metrics(client, "ready")
-                    if len(ready_clients) >= 2 and len(ready_clients) == len(clients):
+                    waiting = [c for c in clients if not c.spectator]
+                    if not game_running and len(ready_clients) >= 2 and len(ready_clients) == len(waiting):
+                        game_running = True
                         asyncio.create_task(self.start_game())
 
                 elif msg.startswith("GUESS:"):
                     guess = msg[len("GUESS:"):].strip()
                     client._last_json = {"type": "guess", "guess": guess}
+                    self.record_replay("in", client.name, client._last_json)
                     self.log_metrics(client, "guess")
 
                 elif msg.startswith("{"):
                     try:
                         json_msg = json.loads(msg)
-                        client._last_json = json_msg
-                        if json_msg.get("type") == "draw":
+                        self.record_replay("in", client.name, json_msg)
+                        if json_msg.get("type") in ("draw", "erase"):
+                            # Only the current drawer's buffer is ever drained, anyone else's strokes are dropped
+                            if not current_round or client is not current_round["drawer"]:
+                                continue
+                            if client.pending_points is None:
+                                client.pending_points = StrokeBuffer()
+                            if json_msg["type"] == "erase":
+                                client.pending_points.append_erase(json_msg["x"], json_msg["y"], time.time())
+                                continue
+                            client.pending_points.append(json_msg["x"], json_msg["y"], json_msg.get("color", "black"), time.time(), json_msg.get("start_new"))
                             self.log_metrics(client, "draw")
-                        elif json_msg.get("type") == "erase":
-                            self.log_metrics(client, "erase")
+                            continue
+                        client._last_json = json_msg
                     except:
                         pass
         except Exception as e:
             print(f"Client error: {e}")
         finally:
-            print(f"Client disconnected: {addr}")
-            self.log_metrics(client, "disconnect")
-            clients.remove(client)
-            ready_clients.discard(client)
+            heartbeat_task.cancel()
+            # A resumed session has already moved on to a newer connection
+            if client.writer is writer:
+                client.close()
+                print(f"Client disconnected: {addr}")
+                self.log_metrics(client, "disconnect")
+                clients.remove(client)
+                ready_clients.discard(client)
+                spectator_feed.discard(client)
+                if client.token:
+                    client.expiry = asyncio.get_running_loop().call_later(SESSION_GRACE, self.expire_session, client)
+
+    def expire_session(self, client):
+        if client.alive:
+            return
+        print(f"Session of {client.name} expired")
+        sessions.pop(client.token, None)
+        client.expired = True
+        client.ready = False
+        client.expiry = None
+
+    def resume_state(self, client):
+        state = {"type": "resumed", "name": client.name, "score": client.score, "ready": client.ready, "round": None, "canvas": []}
+        if current_round and not client.expired and client in current_round["players"]:
+            remaining = max(0, 80 - (time.time() - current_round["start_time"]))
+            role = "draw" if client is current_round["drawer"] else "guess"
+            state["round"] = {"role": role, "length": len(current_round["word"]), "remaining": int(remaining)}
+            state["canvas"] = current_round["canvas"].snapshot()
+        return state
+
+    def spectate_state(self):
+        state = {"type": "spectate", "round": None, "canvas": []}
+        if current_round:
+            remaining = max(0, 80 - (time.time() - current_round["start_time"]))
+            state["round"] = {"drawer": current_round["drawer"].name, "length": len(current_round["word"]), "remaining": int(remaining)}
+            state["canvas"] = current_round["canvas"].snapshot()
+        return state
+
+    async def heartbeat(self, client):
+        while client.alive:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if time.time() - client.last_seen > HEARTBEAT_TIMEOUT:
+                print(f"Heartbeat timeout for {client.name}")
+                client.close()
+                break
+            await client.send_json({"type": "ping"})
+
+    def record_replay(self, direction, who, msg):
+        if current_round and current_round["replay"]:
+            current_round["replay"].record(direction, who, msg)
+
+    async def forward_strokes(self, drawer, guessers):
+        rate = current_round["rate"]
+        window_size = max(SIMPLIFY_WINDOW, int(SIMPLIFY_WINDOW * rate.interval / SIMPLIFY_DELAY))
+        # Points appended while we await the guessers stay queued for the next tick
+        pending = drawer.pending_points
+        count = len(pending) if pending is not None else 0
+        for i in range(count):
+            x, y, color, received, start_new = pending.point(i)
+            if color is None:
+                await self.flush_stroke(drawer, guessers)
+                await self.erase_at(drawer, guessers, x, y)
+                continue
+            drawer.points_in += 1
+            if start_new is None:
+                # Older clients do not mark stroke starts, fall back to the pause between points
+                start_new = drawer.last_draw_time is not None and (received - drawer.last_draw_time) > 0.1
+            if start_new:
+                await self.flush_stroke(drawer, guessers)
+                drawer.last_x = None
+                drawer.last_y = None
+            elif color != drawer.stroke_color:
+                await self.flush_stroke(drawer, guessers)
+            drawer.last_draw_time = received
+            drawer.stroke_color = color
+            if not drawer.stroke_window:
+                drawer.window_started = received
+            if drawer.stroke_window is None:
+                drawer.stroke_window = array("h")
+            drawer.stroke_window.append(x)
+            drawer.stroke_window.append(y)
+            if len(drawer.stroke_window) >= 2 * window_size:
+                await self.flush_stroke(drawer, guessers)
+        if count:
+            pending.consume(count)
+        if drawer.stroke_window and time.time() - drawer.window_started > rate.interval:
+            await self.flush_stroke(drawer, guessers)
+
+    async def flush_stroke(self, drawer, guessers):
+        window = drawer.stroke_window
+        if not window:
+            return
+        points = list(zip(window[::2], window[1::2]))
+        del window[:]
+        rate = current_round["rate"]
+        rate.update(any(g.congested() for g in guessers))
+        if drawer.last_x is None:
+            points = simplify_points(points, rate.tolerance)
+        else:
+            # Anchor on the last point already sent so the stroke stays continuous
+            points = simplify_points([(drawer.last_x, drawer.last_y)] + points, rate.tolerance)[1:]
+        replay = current_round["replay"]
+        color = json.dumps(drawer.stroke_color)
+        lines = []
+        for x, y in points:
+            if drawer.last_x is None:
+                seg_id = None
+                line = STROKE_START % (x, y, color)
+            else:
+                seg_id = current_round["canvas"].add(drawer.last_x, drawer.last_y, x, y, drawer.stroke_color)
+                line = STROKE_POINT % (x, y, color, seg_id)
+            if replay:
+                draw_msg = {"type": "draw", "x": x, "y": y, "color": drawer.stroke_color, "start_new": seg_id is None}
+                if seg_id is not None:
+                    draw_msg["id"] = seg_id
+                replay.record("out", "guessers", draw_msg)
+            spectator_feed.publish_line(line)
+            lines.append(line)
+            drawer.last_x, drawer.last_y = x, y
+        if lines:
+            # One frame per window per guesser, compressed for clients that asked for it
+            frame = ("\n".join(lines) + "\n").encode()
+            packed = None
+            if len(frame) >= COMPRESS_MIN_SIZE and any(g.compress for g in guessers):
+                packed = pack_frame(frame)
+            # The drawer gets its own stroke back too, to swap its raw lines for these segment ids
+            for g in guessers + [drawer]:
+                await g.send_data(frame, packed)
+        drawer.points_out += len(points)
+
+    async def erase_at(self, drawer, guessers, x, y):
+        erased = current_round["canvas"].erase(x, y, ERASE_RADIUS)
+        if erased:
+            erase_msg = {"type": "erase", "ids": erased}
+            self.record_replay("out", "guessers", erase_msg)
+            spectator_feed.publish(erase_msg)
+            for g in guessers + [drawer]:
+                await g.send_json(erase_msg)
+        self.log_metrics(drawer, "erase")
 
     async def start_game(self):
+        global game_running, current_round
         print(events)
         print("Starting game...")
         players = list(ready_clients)
         turn_index = 0
+        game_id = time.strftime("%Y%m%d-%H%M%S")
 
-        while players:
-            drawer = players[turn_index % len(players)]
-            guessers = [c for c in players if c != drawer]
+        while True:
+            players = [p for p in players if not p.expired]
+            active = [p for p in players if p.alive]
+            if len(active) < 2:
+                if len(players) >= 2:
+                    # Someone is inside their reconnect grace period, hold the game
+                    await asyncio.sleep(1)
+                    continue
+                print("Not enough players left, ending game.")
+                for p in players:
+                    p.ready = False
+                    ready_clients.discard(p)
+                    await p.send_json({"type": "status", "message": "Not enough players left. Press 'I'm Ready' to play again."})
+                game_running = False
+                break
+
+            drawer = active[turn_index % len(active)]
+            guessers = [c for c in active if c != drawer]
 
             chosen_words = random.sample(words_list, 3)
             await drawer.send_json({"type": "word_options", "words": chosen_words})
@@ -130,11 +499,20 @@ class ScribbleQUICServer:
             chosen_word = None
             for _ in range(15):
                 await asyncio.sleep(1)
-                msg = getattr(drawer, "_last_json", {})
+                if not drawer.alive:
+                    break
+                msg = drawer._last_json
                 if msg.get("type") == "chosen_word":
                     chosen_word = msg["word"]
+                    drawer._last_json = NO_MESSAGE
                     break
 
+            if not drawer.alive:
+                print(f"{drawer.name} left before choosing a word, skipping turn.")
+                for g in guessers:
+                    await g.send_json({"type": "status", "message": "Drawer left. Next turn."})
+                turn_index += 1
+                continue
             if not chosen_word:
                 print(f"{drawer.name or drawer.addr} did not choose a word, skipping turn.")
                 await drawer.send_json({"type": "status", "message": "You didn't choose a word. Turn skipped."})
@@ -145,81 +523,195 @@ class ScribbleQUICServer:
             
             print(f"{drawer.name} chose word: {chosen_word}")
 
+            replay = ReplayLog(REPLAY_DIR, "quic", game_id, turn_index) if RECORD_REPLAYS else None
+            if replay:
+                replay.record("in", drawer.name, {"type": "chosen_word", "word": chosen_word})
+            guess_round_msg = {"type": "guess_round", "length": len(chosen_word), "message": f"Round started! Word length: {len(chosen_word)}"}
+            draw_round_msg = {"type": "draw_round", "message": "Start drawing!"}
+            if replay:
+                replay.record("out", "guessers", guess_round_msg)
+                replay.record("out", drawer.name, draw_round_msg)
+            spectator_feed.publish(guess_round_msg)
             for g in guessers:
-                await g.send_json({"type": "guess_round", "length": len(chosen_word), "message": f"Round started! Word length: {len(chosen_word)}"})
-            await drawer.send_json({"type": "draw_round", "message": "Start drawing!"})
+                await g.send_json(guess_round_msg)
+            await drawer.send_json(draw_round_msg)
 
             drawer.last_draw_time = None
             drawer.last_x = None
             drawer.last_y = None
+            drawer.pending_points = None
+            drawer.stroke_window = None
+            drawer.points_in = 0
+            drawer.points_out = 0
             for g in guessers:
                 g.last_x = None
                 g.last_y = None
 
             start_time = time.time()
+            rate = RateController(SIMPLIFY_DELAY, SIMPLIFY_TOLERANCE, MAX_SIMPLIFY_DELAY, MAX_SIMPLIFY_TOLERANCE)
+            current_round = {"drawer": drawer, "word": chosen_word, "start_time": start_time, "players": players, "canvas": CanvasIndex(), "replay": replay, "rate": rate}
             correct_guess = False
             while time.time() - start_time < 80:
+                if not drawer.alive:
+                    print(f"{drawer.name} left mid-round.")
+                    break
+                guessers = [p for p in players if p.alive and p != drawer]
+                if not guessers:
+                    break
                 for client in players:
-                    msg = getattr(client, "_last_json", {})
-                    if client == drawer and msg.get("type") == "draw":
-                        current_time = time.time()
-                        if client.last_draw_time is not None and (current_time - client.last_draw_time) > 0.1:
-                            client.last_x = None
-                            client.last_y = None
-                        client.last_draw_time = current_time
-                        x, y = msg["x"], msg["y"]
-                        color = msg.get("color", "black")
-                        for g in guessers:
-                            await g.send_json({"type": "draw", "x": x, "y": y, "color": color, "start_new": client.last_x is None})
-                        client.last_x, client.last_y = x, y
-                        client._last_json = {}
-                    elif client == drawer and msg.get("type") == "erase":
-                        x, y = msg["x"], msg["y"]
-                        for g in guessers:
-                            await g.send_json({"type": "erase", "x": x, "y": y})
-                        client._last_json = {}
-                    elif client in guessers and msg.get("type") == "guess":
+                    if not client.alive:
+                        continue
+                    if client == drawer:
+                        await self.forward_strokes(drawer, guessers)
+                    msg = client._last_json
+                    if client in guessers and msg.get("type") == "guess":
                         guess = msg["guess"].lower()
+                        client._last_json = NO_MESSAGE
                         if guess == chosen_word.lower():
                             client.score += 10
                             drawer.score += 5
                             correct_guess = True
+                            round_end_msg = {
+                                "type": "round_end",
+                                "message": f"{client.name} guessed correctly: {chosen_word}!",
+                                "scores": {p.name: p.score for p in players if not p.expired}
+                            }
+                            self.record_replay("out", "all", round_end_msg)
+                            spectator_feed.publish(round_end_msg)
+                            if node:
+                                await node.run(node.record_scores, round_end_msg["scores"])
                             for p in players:
-                                await p.send_json({
-                                    "type": "round_end",
-                                    "message": f"{client.name} guessed correctly: {chosen_word}!",
-                                    "scores": {p.name: p.score for p in players}
-                                })
+                                await p.send_json(round_end_msg)
                             break
-                        client._last_json = {}
                 if correct_guess:
                     break
-                await asyncio.sleep(0.01)
+                await asyncio.sleep(ROUND_TICK)
 
+            if drawer.points_in:
+                print(f"Stroke simplification forwarded {drawer.points_out}/{drawer.points_in} points, "
+                      f"ending at {rate.tolerance:.1f}px tolerance and {rate.interval * 1000:.0f}ms delay")
+            current_round = None
+            # Whatever the drawer sent after the round ended is never forwarded
+            drawer.pending_points = None
+            drawer.stroke_window = None
             if not correct_guess:
+                if drawer.alive:
+                    message = f"Time's up! The word was: {chosen_word}"
+                else:
+                    message = f"Drawer left! The word was: {chosen_word}"
+                round_end_msg = {
+                    "type": "round_end",
+                    "message": message,
+                    "scores": {p.name: p.score for p in players if not p.expired}
+                }
+                if replay:
+                    replay.record("out", "all", round_end_msg)
+                spectator_feed.publish(round_end_msg)
+                if node:
+                    await node.run(node.record_scores, round_end_msg["scores"])
                 for p in players:
-                    await p.send_json({
-                        "type": "round_end",
-                        "message": f"Time's up! The word was: {chosen_word}",
-                        "scores": {p.name: p.score for p in players}
-                    })
+                    await p.send_json(round_end_msg)
+            if replay:
+                replay.close()
 
             turn_index += 1
             await asyncio.sleep(2)
 
+class PacedQuicServer(QuicServer):
+    # aioquic signs the handshake inline on the event loop, so a burst of joins would
+    # stall every running game. Datagrams for unknown connections are queued and only
+    # HANDSHAKES_PER_TICK of them are admitted per loop iteration; established
+    # connections bypass the queue.
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._backlog = deque()
+        self._admitting = False
+
+    def datagram_received(self, data, addr):
+        try:
+            header = pull_quic_header(Buffer(data=data), host_cid_length=self._configuration.connection_id_length)
+        except ValueError:
+            return
+        if header.destination_cid in self._protocols:
+            super().datagram_received(data, addr)
+            return
+        if len(self._backlog) >= HANDSHAKE_BACKLOG:
+            # The client retransmits its Initial, so dropping here just delays it
+            return
+        self._backlog.append((data, addr))
+        if not self._admitting:
+            self._admitting = True
+            self._loop.call_soon(self._admit)
+
+    def _admit(self):
+        for _ in range(min(HANDSHAKES_PER_TICK, len(self._backlog))):
+            data, addr = self._backlog.popleft()
+            super().datagram_received(data, addr)
+        if self._backlog:
+            self._loop.call_soon(self._admit)
+        else:
+            self._admitting = False
+
 def stream_handler_wrapper(reader, writer):
     server = ScribbleQUICServer()
     asyncio.create_task(server.handle_client(reader, writer))
 
+async def cluster_loop():
+    # Keeps this node's directory entry fresh and relays cluster-wide updates to local players
+    while True:
+        await asyncio.sleep(CLUSTER_INTERVAL)
+        players = sum(1 for c in clients if c.alive and c.name and not c.spectator)
+        updates = await node.run(node.sync, players, not clients and not game_running)
+        for update in updates:
+            for c in list(clients):
+                await c.send_json(update)
+
+def store_ticket(ticket):
+    # Issue order is expiry order, so stale and surplus tickets are always at the front
+    session_tickets[ticket.ticket] = ticket
+    while session_tickets:
+        label, oldest = next(iter(session_tickets.items()))
+        if len(session_tickets) <= MAX_SESSION_TICKETS and oldest.is_valid:
+            break
+        del session_tickets[label]
+
+def fetch_ticket(label):
+    ticket = session_tickets.pop(label, None)
+    return ticket if ticket is not None and ticket.is_valid else None
+
 async def main():
+    global node
     configuration = QuicConfiguration(
         alpn_protocols=["scribble"],
         is_client=False,
+        idle_timeout=HEARTBEAT_TIMEOUT,
+    )
+    configuration.load_cert_chain(CERT_FILE, KEY_FILE)
+    key_type = type(configuration.private_key).__name__
+    print(f"Loaded {key_type} certificate")
+    if "RSA" in key_type:
+        print("RSA keys make every full handshake expensive, consider an ECDSA or Ed25519 certificate")
+    loop = asyncio.get_running_loop()
+    # Resumed sessions (tickets below) skip certificate signing entirely
+    await loop.create_datagram_endpoint(
+        lambda: PacedQuicServer(
+            configuration=configuration,
+            stream_handler=stream_handler_wrapper,
+            session_ticket_fetcher=fetch_ticket,
+            session_ticket_handler=store_ticket,
+        ),
+        local_addr=(ADDRESS, PORT),
     )
-    configuration.load_cert_chain("../server_cert.pem", "../server_key.pem")
-    await serve(ADDRESS, PORT, configuration=configuration, stream_handler=stream_handler_wrapper)
-    print("Server started on port 4433")
-    await asyncio.Future()
+    print(f"Server started on port {PORT}")
+    if CLUSTER_DB:
+        node = Cluster(CLUSTER_DB, f"quic-{PUBLIC_HOST}:{PORT}", PUBLIC_HOST, PORT, "quic")
+        asyncio.create_task(cluster_loop())
+        print(f"Joined cluster {CLUSTER_DB} as {node.node_id}")
+    try:
+        await asyncio.Future()
+    finally:
+        if node:
+            node.leave()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
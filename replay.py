@@ -0,0 +1,223 @@
+import argparse
+import asyncio
+import gzip
+import json
+import time
+
+HOST = "localhost"
+PORT = 4433
+KEEPALIVE_INTERVAL = 5
+
+def load_replay(path):
+    with gzip.open(path, "rt") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def load_rounds(paths):
+    rounds = []
+    for path in sorted(paths):
+        events = load_replay(path)
+        chosen = next((e for e in events if e[1] == "in" and e[3].get("type") == "chosen_word"), None)
+        if chosen is None:
+            print(f"{path}: no chosen word recorded, skipping")
+            continue
+        drawer = chosen[2]
+        rounds.append({
+            "path": path,
+            "word": chosen[3]["word"],
+            "events": events,
+            "inputs": [e for e in events if e[1] == "in" and e[2] == drawer and e[3].get("type") in ("draw", "erase")],
+            "outputs": [e for e in events if e[1] == "out" and e[2] in ("guessers", "all")],
+        })
+    return rounds
+
+async def paced(events, speed):
+    start = time.perf_counter()
+    for event in events:
+        delay = event[0] / speed - (time.perf_counter() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield event
+
+def encode(msg):
+    return json.dumps(msg).encode() + b"\n"
+
+async def keepalive(writer):
+    # The clients drop the connection after HEARTBEAT_TIMEOUT seconds of silence
+    while True:
+        await asyncio.sleep(KEEPALIVE_INTERVAL)
+        writer.write(encode({"type": "ping"}))
+
+async def stream_to_client(reader, writer, rounds, speed):
+    # Plays the guesser's view of every round, a stand-in for a real server
+    ping_task = asyncio.create_task(keepalive(writer))
+    try:
+        writer.write(encode({"type": "status", "message": f"Replaying {len(rounds)} round(s) at {speed}x"}))
+        for rnd in rounds:
+            print(f"Streaming {rnd['path']}")
+            async for _, _, _, msg in paced(rnd["outputs"], speed):
+                writer.write(encode(msg))
+                await writer.drain()
+            await asyncio.sleep(2 / speed)
+        writer.write(encode({"type": "status", "message": "Replay finished"}))
+        await writer.drain()
+    except ConnectionError:
+        print("Viewer disconnected")
+    finally:
+        ping_task.cancel()
+        writer.close()
+
+async def serve_replay(args, rounds):
+    def handler(reader, writer):
+        asyncio.create_task(stream_to_client(reader, writer, rounds, args.speed))
+
+    if args.quic:
+        from aioquic.asyncio import serve
+        from aioquic.quic.configuration import QuicConfiguration
+        configuration = QuicConfiguration(alpn_protocols=["scribble"], is_client=False)
+        configuration.load_cert_chain(args.cert, args.key)
+        await serve(args.host, args.port, configuration=configuration, stream_handler=handler)
+        print(f"Replay QUIC server on {args.host}:{args.port}")
+        await asyncio.Future()
+    else:
+        server = await asyncio.start_server(handler, args.host, args.port)
+        print(f"Replay TCP server on {args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+
+class Bot:
+    def __init__(self, driver, name):
+        self.driver = driver
+        self.name = name
+        self.writer = None
+        self.messages = 0
+        self.draws = 0
+        self.bytes_received = 0
+
+    def send(self, line):
+        self.writer.write(line.encode() + b"\n")
+
+    async def run(self, reader):
+        while not self.driver.done.is_set():
+            line = await reader.readline()
+            if not line:
+                break
+            self.bytes_received += len(line)
+            self.messages += 1
+            msg = json.loads(line)
+            msg_type = msg.get("type")
+            if msg_type == "ping":
+                self.send("PONG")
+            elif msg_type == "word_options":
+                self.send(json.dumps({"type": "chosen_word", "word": self.driver.current["word"]}))
+            elif msg_type == "draw_round":
+                asyncio.create_task(self.driver.draw(self))
+            elif msg_type in ("draw", "erase"):
+                self.draws += 1
+            elif msg_type == "round_end":
+                self.driver.round_ended(self)
+
+class ReplayDriver:
+    # Headless players that redraw recorded rounds against a live server
+    def __init__(self, rounds, players, speed, max_rounds):
+        self.rounds = rounds
+        self.speed = speed
+        self.max_rounds = max_rounds
+        self.bots = [Bot(self, f"bot{i}") for i in range(players)]
+        self.round_no = 0
+        self.current = rounds[0]
+        self.points_sent = 0
+        self.round_times = []
+        self.round_start = None
+        self.done = asyncio.Event()
+
+    async def draw(self, drawer):
+        self.round_start = time.perf_counter()
+        async for _, _, _, msg in paced(self.current["inputs"], self.speed):
+            drawer.send(json.dumps(msg))
+            self.points_sent += 1
+        await asyncio.sleep(0.2)
+        # Someone "guesses" once the drawing is done so rounds do not wait for the timer
+        guesser = next(bot for bot in self.bots if bot is not drawer)
+        guesser.send(f"GUESS:{self.current['word']}")
+
+    def round_ended(self, bot):
+        if bot is not self.bots[0]:
+            return
+        if self.round_start is not None:
+            self.round_times.append(time.perf_counter() - self.round_start)
+        self.round_no += 1
+        self.current = self.rounds[self.round_no % len(self.rounds)]
+        if self.round_no >= self.max_rounds:
+            self.done.set()
+
+async def open_stream(args):
+    if not args.quic:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+        return None, reader, writer
+    from aioquic.asyncio import connect
+    from aioquic.quic.configuration import QuicConfiguration
+    configuration = QuicConfiguration(alpn_protocols=["scribble"], is_client=True, server_name=args.host)
+    configuration.load_verify_locations(args.cert)
+    connection = connect(args.host, args.port, configuration=configuration)
+    protocol = await connection.__aenter__()
+    reader, writer = await protocol.create_stream()
+    return connection, reader, writer
+
+async def drive_server(args, rounds):
+    driver = ReplayDriver(rounds, args.players, args.speed, args.rounds)
+    connections = []
+    tasks = []
+    start = time.perf_counter()
+    for bot in driver.bots:
+        connection, reader, writer = await open_stream(args)
+        connections.append((connection, writer))
+        bot.writer = writer
+        bot.send(f"USERNAME:{bot.name}")
+        tasks.append(asyncio.create_task(bot.run(reader)))
+    # Everyone joins before anyone is ready, otherwise the game starts with the first two
+    for bot in driver.bots:
+        bot.send("READY")
+    await asyncio.wait([asyncio.create_task(driver.done.wait())] + tasks, return_when=asyncio.FIRST_COMPLETED)
+    elapsed = time.perf_counter() - start
+    for connection, writer in connections:
+        writer.close()
+        if connection is not None:
+            await connection.__aexit__(None, None, None)
+    for task in tasks:
+        task.cancel()
+
+    received = sum(bot.draws for bot in driver.bots)
+    total_bytes = sum(bot.bytes_received for bot in driver.bots)
+    print(f"Rounds played: {driver.round_no}")
+    print(f"Drawer events sent: {driver.points_sent}")
+    print(f"Stroke messages received: {received} ({received / max(elapsed, 1e-9):.1f}/s)")
+    print(f"Bytes received: {total_bytes}")
+    if driver.round_times:
+        print(f"Average round time (s): {sum(driver.round_times) / len(driver.round_times):.3f}")
+    print(f"Elapsed (s): {elapsed:.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Play back recorded scribble rounds")
+    parser.add_argument("mode", choices=["serve", "drive"], help="serve: stream to a GUI client, drive: replay the drawer against a server")
+    parser.add_argument("files", nargs="+", help="replay files written by the servers (replays/*.jsonl.gz)")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed multiplier")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--quic", action="store_true", help="use QUIC instead of TCP")
+    parser.add_argument("--cert", default="server_cert.pem")
+    parser.add_argument("--key", default="server_key.pem")
+    parser.add_argument("--players", type=int, default=3, help="drive mode: number of headless players")
+    parser.add_argument("--rounds", type=int, default=3, help="drive mode: rounds to play before stopping")
+    args = parser.parse_args()
+
+    rounds = load_rounds(args.files)
+    if not rounds:
+        print("Nothing to replay.")
+        return
+    if args.mode == "serve":
+        asyncio.run(serve_replay(args, rounds))
+    else:
+        asyncio.run(drive_server(args, rounds))
+
+if __name__ == "__main__":
+    main()
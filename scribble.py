@@ -0,0 +1,291 @@
+import asyncio
+import gzip
+import json
+import math
+import os
+import struct
+import time
+from array import array
+
+from framing import COMPRESS_MIN_SIZE, pack_frame
+
+# Game pieces both servers and both clients share. Every program imports this module from the
+# repository root the same way it imports framing.py and cluster.py.
+GRID_CELL = 32
+ERASE_RADIUS = 6
+# AIMD steps for RateController
+RATE_INTERVAL_STEP = 0.01
+RATE_TOLERANCE_STEP = 0.25
+# A TCP link counts as congested with this much queued for it or a drain this slow
+CONGESTION_QUEUE = 16 * 1024
+CONGESTION_DRAIN = 0.05
+# A QUIC link counts as congested once this share of the window is in flight or the RTT has
+# inflated this far over its minimum
+CONGESTION_CWND_SHARE = 0.8
+RTT_INFLATION = 2.0
+RTT_SLACK = 0.02
+SPECTATOR_INTERVAL = 0.1
+SPECTATOR_MAX_BUFFER = 1 << 20
+# Stroke buffers store colours as small codes into this fixed palette, the one the clients offer.
+# Anything else is drawn in the first colour
+COLOR_NAMES = ("black", "red", "blue", "green")
+COLOR_CODES = {name: code for code, name in enumerate(COLOR_NAMES)}
+POINT = struct.Struct("=hhh")
+# Stroke-start flag value that marks a queued erase instead of a draw point
+ERASE_FLAG = 3
+
+def simplify_points(points, tolerance):
+    # Radial-distance pass drops jitter, then Ramer-Douglas-Peucker drops collinear points.
+    # The first and last points are always kept so consecutive windows stay joined.
+    if tolerance <= 0 or len(points) < 3:
+        return points
+    reduced = [points[0]]
+    for x, y in points[1:-1]:
+        px, py = reduced[-1]
+        if math.hypot(x - px, y - py) > tolerance:
+            reduced.append((x, y))
+    reduced.append(points[-1])
+    keep = [False] * len(reduced)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(reduced) - 1)]
+    while stack:
+        start, end = stack.pop()
+        (x1, y1), (x2, y2) = reduced[start], reduced[end]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        max_dist, index = 0, None
+        for i in range(start + 1, end):
+            px, py = reduced[i]
+            if length:
+                dist = abs(dy * (px - x1) - dx * (py - y1)) / length
+            else:
+                dist = math.hypot(px - x1, py - y1)
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if index is not None and max_dist > tolerance:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return [p for p, k in zip(reduced, keep) if k]
+
+def color_code(color):
+    return COLOR_CODES.get(color, 0) if isinstance(color, str) else 0
+
+class StrokeBuffer:
+    # Drawer points waiting for the round loop as three shorts each (x, y, colour code and
+    # stroke-start flag) plus the receive time, instead of a tuple of Python objects per point
+    __slots__ = ("points", "times")
+
+    def __init__(self):
+        self.points = array("h")
+        self.times = array("d")
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, x, y, color, received, start_new):
+        # Packing first means a bad point raises before anything is stored
+        flag = 2 if start_new is None else int(bool(start_new))
+        self.points.frombytes(POINT.pack(x, y, color_code(color) << 2 | flag))
+        self.times.append(received)
+
+    def append_erase(self, x, y, received):
+        # Erases share the queue so they apply to exactly the points drawn before them
+        self.points.frombytes(POINT.pack(x, y, ERASE_FLAG))
+        self.times.append(received)
+
+    def point(self, i):
+        # Erases come back with a colour of None
+        x, y, meta = self.points[3 * i], self.points[3 * i + 1], self.points[3 * i + 2]
+        flag = meta & 3
+        if flag == ERASE_FLAG:
+            return x, y, None, self.times[i], None
+        return x, y, COLOR_NAMES[meta >> 2], self.times[i], None if flag == 2 else bool(flag)
+
+    def consume(self, count):
+        # Drops points the round loop has handled, anything appended meanwhile stays queued
+        del self.points[:3 * count]
+        del self.times[:count]
+
+class RateController:
+    # AIMD on stroke fidelity: double the batching delay and tolerance as soon as the link
+    # is congested, then win them back a step at a time once it has drained
+    def __init__(self, interval, tolerance, max_interval, max_tolerance):
+        self.min_interval = interval
+        self.min_tolerance = tolerance
+        self.max_interval = max_interval
+        self.max_tolerance = max_tolerance
+        self.interval = interval
+        self.tolerance = tolerance
+
+    def update(self, congested):
+        if congested:
+            self.interval = min(max(self.interval * 2, RATE_INTERVAL_STEP), self.max_interval)
+            self.tolerance = min(max(self.tolerance * 2, 1.0), self.max_tolerance)
+        else:
+            self.interval = max(self.interval - RATE_INTERVAL_STEP, self.min_interval)
+            self.tolerance = max(self.tolerance - RATE_TOLERANCE_STEP, self.min_tolerance)
+
+def decimate(messages, tolerance):
+    # Drops draw points closer than tolerance to the last kept one. Stroke starts and ends,
+    # colour changes and erases always go through.
+    kept = []
+    last = None
+    for i, msg in enumerate(messages):
+        following = messages[i + 1] if i + 1 < len(messages) else None
+        if msg["type"] == "draw":
+            boundary = (msg["start_new"] or last is None or last[2] != msg["color"] or following is None
+                        or following["type"] != "draw" or following["start_new"] or following["color"] != msg["color"])
+            if not boundary and math.hypot(msg["x"] - last[0], msg["y"] - last[1]) < tolerance:
+                continue
+            last = (msg["x"], msg["y"], msg["color"])
+        else:
+            last = None
+        kept.append(msg)
+    return kept
+
+def quic_congested(writer):
+    # The QUIC probes read aioquic's private state, anything missing counts as an idle link
+    loss = getattr(getattr(getattr(writer.transport, "protocol", None), "_quic", None), "_loss", None)
+    if loss is None:
+        return False
+    if loss.bytes_in_flight >= CONGESTION_CWND_SHARE * loss.congestion_window:
+        return True
+    rtt_min = getattr(loss, "_rtt_min", math.inf)
+    return rtt_min != math.inf and getattr(loss, "_rtt_smoothed", 0.0) > rtt_min * RTT_INFLATION + RTT_SLACK
+
+def quic_backlog(writer):
+    # Bytes aioquic still holds for the writer's stream, unsent or unacknowledged
+    transport = writer.transport
+    streams = getattr(getattr(getattr(transport, "protocol", None), "_quic", None), "_streams", {})
+    stream = streams.get(getattr(transport, "stream_id", None))
+    return len(getattr(getattr(stream, "sender", None), "_buffer", b""))
+
+def segment_distance(px, py, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    if dx == 0 and dy == 0:
+        return math.hypot(px - x1, py - y1)
+    t = max(0, min(1, ((px - x1) * dx + (py - y1) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+
+class CanvasIndex:
+    # Uniform grid over line segments so erasing only hit-tests nearby strokes. The servers key
+    # segments by the ids they hand out, the clients by their canvas item ids
+    def __init__(self, cell_size=GRID_CELL):
+        self.cell_size = cell_size
+        self.segments = {}
+        self.cells = {}
+        self.next_id = 0
+
+    def _cells(self, x1, y1, x2, y2):
+        size = self.cell_size
+        for cx in range(int(min(x1, x2)) // size, int(max(x1, x2)) // size + 1):
+            for cy in range(int(min(y1, y2)) // size, int(max(y1, y2)) // size + 1):
+                yield (cx, cy)
+
+    def add(self, x1, y1, x2, y2, color, seg_id=None):
+        if seg_id is None:
+            seg_id = self.next_id
+            self.next_id += 1
+        self.segments[seg_id] = (x1, y1, x2, y2, color)
+        for cell in self._cells(x1, y1, x2, y2):
+            self.cells.setdefault(cell, set()).add(seg_id)
+        return seg_id
+
+    def remove(self, seg_id):
+        segment = self.segments.pop(seg_id, None)
+        if segment is None:
+            return
+        for cell in self._cells(*segment[:4]):
+            ids = self.cells.get(cell)
+            if ids is not None:
+                ids.discard(seg_id)
+                if not ids:
+                    del self.cells[cell]
+
+    def hits(self, x, y, radius):
+        hits = set()
+        for cell in self._cells(x - radius, y - radius, x + radius, y + radius):
+            for seg_id in self.cells.get(cell, ()):
+                if seg_id not in hits and segment_distance(x, y, *self.segments[seg_id][:4]) <= radius:
+                    hits.add(seg_id)
+        return hits
+
+    def erase(self, x, y, radius):
+        hits = self.hits(x, y, radius)
+        for seg_id in hits:
+            self.remove(seg_id)
+        return sorted(hits)
+
+    def snapshot(self):
+        return [[seg_id, *segment] for seg_id, segment in self.segments.items()]
+
+class ReplayLog:
+    # One gzip member per round: [seconds since round start, "in"/"out", player or audience, message]
+    def __init__(self, directory, protocol, game_id, round_no):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{protocol}_{game_id}_round{round_no:03d}.jsonl.gz")
+        self.file = gzip.open(self.path, "at")
+        self.start_time = time.time()
+
+    def record(self, direction, who, msg):
+        event = [round(time.time() - self.start_time, 3), direction, who, msg]
+        self.file.write(json.dumps(event, separators=(",", ":")) + "\n")
+
+    def close(self):
+        self.file.close()
+
+class SpectatorFeed:
+    # Events are encoded once per room and written to every spectator as one shared frame
+    # every interval, so a stroke costs the same no matter how many are watching. Spectators
+    # are server Clients, which provide queue(data) and backlog() for their transport
+    def __init__(self, interval=SPECTATOR_INTERVAL, max_backlog=SPECTATOR_MAX_BUFFER):
+        self.interval = interval
+        self.max_backlog = max_backlog
+        self.spectators = set()
+        self.pending = []
+        self.task = None
+
+    def add(self, client):
+        self.spectators.add(client)
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def discard(self, client):
+        self.spectators.discard(client)
+
+    def publish(self, msg):
+        if self.spectators:
+            self.pending.append(json.dumps(msg))
+
+    def publish_line(self, line):
+        if self.spectators:
+            self.pending.append(line)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        frame = ("\n".join(self.pending) + "\n").encode()
+        self.pending = []
+        packed = None
+        for spectator in list(self.spectators):
+            if not spectator.alive:
+                self.spectators.discard(spectator)
+                continue
+            if spectator.backlog() > self.max_backlog:
+                # Too slow to keep up, drop it rather than buffer strokes forever
+                print(f"Dropping slow spectator {spectator.name or 'anonymous'}")
+                spectator.close()
+                self.spectators.discard(spectator)
+                continue
+            if spectator.compress and len(frame) >= COMPRESS_MIN_SIZE:
+                if packed is None:
+                    packed = pack_frame(frame)
+                spectator.queue(packed)
+            else:
+                spectator.queue(frame)
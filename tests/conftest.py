@@ -0,0 +1,93 @@
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bench_game
+import memory_transport
+
+@pytest.fixture(params=["tcp", "quic"])
+def server(request, tmp_path, monkeypatch):
+    # A fresh copy of the server module running from a throwaway directory, like bench_game.py does
+    monkeypatch.chdir(tmp_path)
+    module = bench_game.load_server(request.param, str(tmp_path))
+    module.RECORD_REPLAYS = False
+    module.kind = request.param
+    return module
+
+def handler_for(module):
+    if module.kind == "tcp":
+        return module.ScribbleTCPServer().handle_client
+    return module.stream_handler_wrapper
+
+class Player:
+    def __init__(self, name, reader, writer):
+        self.name = name
+        self.reader = reader
+        self.writer = writer
+        self.received = []
+        self.arrived = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    def send(self, *lines):
+        self.writer.write("".join(line + "\n" for line in lines).encode())
+
+    async def run(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            msg = json.loads(line)
+            if msg["type"] == "ping":
+                self.send("PONG")
+                continue
+            self.received.append(msg)
+            self.arrived.set()
+
+    def of_type(self, msg_type):
+        return [msg for msg in self.received if msg["type"] == msg_type]
+
+    async def expect(self, msg_type, timeout=5):
+        async def wait():
+            while not self.of_type(msg_type):
+                self.arrived.clear()
+                await self.arrived.wait()
+            return self.of_type(msg_type)[-1]
+        return await asyncio.wait_for(wait(), timeout)
+
+    def close(self):
+        self.writer.close()
+        self.task.cancel()
+
+async def connect(handler, name=None):
+    reader, writer = await memory_transport.open_connection(handler)
+    player = Player(name, reader, writer)
+    if name:
+        player.send(f"USERNAME:{name}")
+        await player.expect("session")
+    return player
+
+async def start_round(module, names=("a", "b", "c")):
+    # Connects the players, readies them and has whoever is picked to draw choose a word
+    handler = handler_for(module)
+    players = [await connect(handler, name) for name in names]
+    for player in players:
+        player.send("READY")
+    drawer = None
+    while drawer is None:
+        await asyncio.sleep(0.05)
+        drawer = next((p for p in players if p.of_type("word_options")), None)
+    drawer.send(json.dumps({"type": "chosen_word", "word": drawer.of_type("word_options")[0]["words"][0]}))
+    await drawer.expect("draw_round")
+    return drawer, [p for p in players if p is not drawer], players
+
+def stroke(points, color="black"):
+    return [json.dumps({"type": "draw", "x": x, "y": y, "color": color, "start_new": i == 0}) for i, (x, y) in enumerate(points)]
+
+def erase(x, y):
+    return json.dumps({"type": "erase", "x": x, "y": y})
@@ -0,0 +1,19 @@
+from scribble import ERASE_RADIUS, CanvasIndex
+
+def test_erase_only_removes_nearby_segments():
+    index = CanvasIndex()
+    near = index.add(0, 0, 100, 0, "black")
+    far = index.add(0, 50, 100, 50, "red")
+    assert index.erase(50, 3, ERASE_RADIUS) == [near]
+    assert index.erase(50, 3, ERASE_RADIUS) == []
+    assert index.snapshot() == [[far, 0, 50, 100, 50, "red"]]
+
+def test_hits_leave_segments_until_erased():
+    # The clients key segments by their own canvas item ids
+    index = CanvasIndex()
+    index.add(0, 0, 100, 0, "black", seg_id=7)
+    index.add(0, 0, 0, 100, "red", seg_id=8)
+    assert index.hits(50, 2, ERASE_RADIUS) == {7}
+    assert index.hits(2, 2, ERASE_RADIUS) == {7, 8}
+    assert index.erase(2, 2, ERASE_RADIUS) == [7, 8]
+    assert index.segments == {} and index.cells == {}
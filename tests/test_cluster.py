@@ -0,0 +1,50 @@
+import threading
+
+from cluster import Cluster
+
+def make_nodes(tmp_path, count):
+    path = str(tmp_path / "cluster.db")
+    return [Cluster(path, f"tcp-n{i}", "127.0.0.1", 9000 + i, "tcp") for i in range(count)]
+
+def test_locate_claims_a_free_room_once(tmp_path):
+    first, second = make_nodes(tmp_path, 2)
+    assert first.locate("blue")["node_id"] == "tcp-n0"
+    assert second.locate("blue")["node_id"] == "tcp-n0"
+    assert second.room is None
+    # A node that already hosts a room redirects new rooms to a free node
+    assert first.locate("red")["node_id"] == "tcp-n1"
+    assert first.lobby() == {"blue": 0}
+
+def test_racing_claims_have_one_winner(tmp_path):
+    nodes = make_nodes(tmp_path, 8)
+    barrier = threading.Barrier(len(nodes))
+    results = {}
+
+    def race(node):
+        barrier.wait()
+        results[node.node_id] = node.claim("blue")
+
+    threads = [threading.Thread(target=race, args=(node,)) for node in nodes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(results.values()) == 1
+    assert [node.room for node in nodes].count("blue") == 1
+
+def test_dead_host_gives_up_its_room(tmp_path):
+    first, second = make_nodes(tmp_path, 2)
+    assert first.claim("blue")
+    first.db.execute("UPDATE nodes SET last_seen = 0 WHERE node_id = ?", (first.node_id,))
+    assert second.locate("blue")["node_id"] == "tcp-n1"
+
+def test_sync_relays_lobby_and_scores(tmp_path):
+    first, second = make_nodes(tmp_path, 2)
+    first.claim("blue")
+    first.record_scores({"ann": 3, "bob": 1})
+    updates = second.sync(0, True)
+    assert {"type": "lobby", "rooms": {"blue": 0}} in updates
+    assert {"type": "leaderboard", "top": [["ann", "blue", 3], ["bob", "blue", 1]]} in updates
+    # An idle node hands its room back
+    first.sync(0, True)
+    assert first.room is None and second.lobby() == {}
@@ -0,0 +1,60 @@
+import asyncio
+
+import scribble
+from conftest import connect, handler_for, start_round, stroke
+from scribble import StrokeBuffer, simplify_points
+
+def test_unknown_colours_fall_back_to_black(server):
+    palette = scribble.COLOR_NAMES
+
+    async def run():
+        drawer, guessers, players = await start_round(server)
+        drawer.send(*stroke([(x, 50) for x in range(100, 150, 10)], color="#ff00ff"),
+                    *stroke([(x, 80) for x in range(100, 150, 10)], color=["red"]),
+                    *stroke([(x, 110) for x in range(100, 150, 10)], color="blue"))
+        await asyncio.sleep(0.5)
+        colors = {msg["y"]: msg["color"] for msg in guessers[0].of_type("draw")}
+        assert colors == {50: "black", 80: "black", 110: "blue"}
+        for player in players:
+            player.close()
+    asyncio.run(run())
+    assert scribble.COLOR_NAMES == palette
+
+def test_stroke_buffer_round_trips_points_and_erases():
+    buffer = StrokeBuffer()
+    buffer.append(1, 2, "red", 0.5, True)
+    buffer.append_erase(3, 4, 0.6)
+    buffer.append(5, 6, "green", 0.7, None)
+    assert [buffer.point(i) for i in range(len(buffer))] == [(1, 2, "red", 0.5, True), (3, 4, None, 0.6, None),
+                                                             (5, 6, "green", 0.7, None)]
+    buffer.consume(2)
+    assert len(buffer) == 1 and buffer.point(0)[:2] == (5, 6)
+
+def test_only_the_current_drawer_strokes_are_queued(server):
+    async def run():
+        drawer, guessers, players = await start_round(server)
+        lurker = await connect(handler_for(server))
+        lurker.send(*stroke([(x, 50) for x in range(100, 200, 10)]))
+        guessers[0].send(*stroke([(x, 80) for x in range(100, 200, 10)]))
+        drawer.send(*stroke([(x, 110) for x in range(100, 200, 10)]))
+        await guessers[1].expect("draw")
+        await asyncio.sleep(0.3)
+        drawing = server.current_round["drawer"]
+        assert all(c.pending_points is None for c in server.clients if c is not drawing)
+        assert {msg["y"] for msg in guessers[1].of_type("draw")} == {110}
+        # Nothing the drawer sent stays buffered once the round is over
+        guessers[0].send(f"GUESS:{drawer.of_type('word_options')[0]['words'][0]}")
+        await guessers[0].expect("round_end")
+        # round_end goes out before the round loop lets go of the round
+        await asyncio.sleep(0.1)
+        assert drawing.pending_points is None and drawing.stroke_window is None
+        for player in players + [lurker]:
+            player.close()
+    asyncio.run(run())
+
+def test_simplify_drops_collinear_points_and_keeps_the_ends():
+    line = [(x, 10) for x in range(0, 100, 5)]
+    assert simplify_points(line, 1.0) == [(0, 10), (95, 10)]
+    corner = [(x, 0) for x in range(0, 50, 5)] + [(50, y) for y in range(0, 50, 5)]
+    assert simplify_points(corner, 1.0) == [(0, 0), (50, 0), (50, 45)]
+    assert simplify_points(line, 0) == line
@@ -0,0 +1,46 @@
+import asyncio
+
+from conftest import erase, start_round, stroke
+
+def segments(player):
+    # id -> (start, end, colour) as the player drew them from draw messages
+    result = {}
+    last = None
+    for msg in player.of_type("draw"):
+        if msg["start_new"]:
+            last = None
+        if last is not None:
+            result[msg["id"]] = (last, (msg["x"], msg["y"]), msg["color"])
+        last = (msg["x"], msg["y"])
+    return result
+
+def test_erases_in_one_tick_all_apply(server):
+    async def run():
+        drawer, guessers, players = await start_round(server)
+        drawer.send(*stroke([(x, 50) for x in range(100, 210, 10)]),
+                    *stroke([(x, 200) for x in range(100, 210, 10)]),
+                    erase(150, 50), erase(150, 200))
+        await asyncio.sleep(0.5)
+        for player in guessers + [drawer]:
+            drawn = segments(player)
+            erased = [[drawn[i][0][1] for i in msg["ids"]] for msg in player.of_type("erase")]
+            assert erased == [[50], [200]]
+        for player in players:
+            player.close()
+    asyncio.run(run())
+
+def test_erase_only_hits_what_was_drawn_before_it(server):
+    async def run():
+        drawer, guessers, players = await start_round(server)
+        drawer.send(*stroke([(x, 50) for x in range(100, 210, 10)]),
+                    erase(150, 50),
+                    *stroke([(150, y) for y in range(30, 80, 10)], color="red"))
+        await asyncio.sleep(0.5)
+        for player in guessers + [drawer]:
+            drawn = segments(player)
+            erased = [i for msg in player.of_type("erase") for i in msg["ids"]]
+            assert erased and all(drawn[i][2] == "black" for i in erased)
+            assert any(color == "red" for _, _, color in drawn.values())
+        for player in players:
+            player.close()
+    asyncio.run(run())
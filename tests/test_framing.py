@@ -0,0 +1,29 @@
+import asyncio
+
+from framing import pack_frame, read_frame
+
+def read_all(data):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        frames = []
+        while True:
+            frame = await read_frame(reader)
+            if not frame:
+                return frames
+            frames.append(frame)
+    return asyncio.run(run())
+
+def test_frames_round_trip():
+    lines = b"".join(b'{"type": "draw", "x": %d, "y": 7, "color": "red", "start_new": false, "id": %d}\n' % (i, i)
+                     for i in range(40))
+    packed = pack_frame(lines)
+    assert packed[0] == 0 and len(packed) < len(lines) // 4
+    assert read_all(b'{"type": "ping"}\n' + packed) == [b'{"type": "ping"}\n', lines]
+
+def test_frames_that_would_grow_stay_plain():
+    assert pack_frame(b"ok\n") == b"ok\n"
+
+def test_corrupt_frame_reads_as_closed():
+    assert read_all(b"\x00" + (4).to_bytes(4, "big") + b"\xff\xff\xff\xff") == []
@@ -0,0 +1,70 @@
+import asyncio
+
+from conftest import connect, handler_for
+
+def test_resume_over_a_live_connection_is_listed_once(server):
+    async def run():
+        handler = handler_for(server)
+        ann = await connect(handler, "ann")
+        bob = await connect(handler, "bob")
+        token = ann.of_type("session")[0]["token"]
+        # The first connection has not noticed it is dead yet when the player comes back
+        again = await connect(handler)
+        again.send(f"RESUME:{token}")
+        resumed = await again.expect("resumed")
+        assert resumed["name"] == "ann"
+        await asyncio.sleep(0.2)
+        assert [c.name for c in server.clients].count("ann") == 1
+        # The game still starts once everyone listed is ready
+        again.send("READY")
+        bob.send("READY")
+        done, _ = await asyncio.wait([asyncio.create_task(p.expect("word_options", timeout=3)) for p in (again, bob)],
+                                     return_when=asyncio.FIRST_COMPLETED)
+        assert done.pop().result()["type"] == "word_options"
+        for player in (ann, bob, again):
+            player.close()
+    asyncio.run(run())
+
+def test_resume_after_disconnect_keeps_score_and_ready(server):
+    async def run():
+        handler = handler_for(server)
+        ann = await connect(handler, "ann")
+        token = ann.of_type("session")[0]["token"]
+        ann.send("READY")
+        await ann.expect("status")
+        ann.close()
+        await asyncio.sleep(0.2)
+        again = await connect(handler)
+        again.send(f"RESUME:{token}")
+        resumed = await again.expect("resumed")
+        assert (resumed["name"], resumed["score"], resumed["ready"]) == ("ann", 0, True)
+        stranger = await connect(handler)
+        stranger.send("RESUME:not-a-token")
+        await stranger.expect("resume_failed")
+        for player in (again, stranger):
+            player.close()
+    asyncio.run(run())
+
+def test_resume_is_refused_once_the_connection_has_a_session(server):
+    async def run():
+        handler = handler_for(server)
+        ann = await connect(handler, "ann")
+        bob = await connect(handler, "bob")
+        token = ann.of_type("session")[0]["token"]
+        ann.close()
+        await asyncio.sleep(0.2)
+        again = await connect(handler)
+        again.send(f"RESUME:{token}")
+        await again.expect("resumed")
+        # A second RESUME on the same connection would strand the first session
+        again.send(f"RESUME:{bob.of_type('session')[0]['token']}")
+        await again.expect("resume_failed")
+        # So would resuming after naming the connection, leaving its own token behind
+        named = await connect(handler, "cat")
+        named.send(f"RESUME:{token}")
+        await named.expect("resume_failed")
+        assert len(server.sessions) == 3
+        assert [c.name for c in server.clients] == ["bob", "ann", "cat"]
+        for player in (bob, again, named):
+            player.close()
+    asyncio.run(run())
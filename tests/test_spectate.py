@@ -0,0 +1,60 @@
+import asyncio
+
+from conftest import connect, handler_for, start_round, stroke
+
+def test_late_spectator_gets_each_segment_once(server):
+    # Long enough that strokes are still pending in the feed when the second spectator joins
+    server.spectator_feed.interval = 60
+
+    async def run():
+        handler = handler_for(server)
+        early = await connect(handler)
+        early.send("SPECTATE")
+        await early.expect("spectate")
+        drawer, guessers, players = await start_round(server)
+        drawer.send(*stroke([(x, 50) for x in range(100, 210, 10)]))
+        await guessers[0].expect("draw")
+        await asyncio.sleep(0.3)
+        late = await connect(handler)
+        late.send("SPECTATE")
+        snapshot = await late.expect("spectate")
+        server.spectator_feed.flush()
+        await asyncio.sleep(0.1)
+        shown = [seg[0] for seg in snapshot["canvas"]] + [msg["id"] for msg in late.of_type("draw") if "id" in msg]
+        assert shown and len(shown) == len(set(shown))
+        assert sorted(msg["id"] for msg in early.of_type("draw") if "id" in msg) == sorted(shown)
+        for player in players + [early, late]:
+            player.close()
+    asyncio.run(run())
+
+def test_spectating_gives_up_the_ready_slot(server):
+    async def run():
+        handler = handler_for(server)
+        ann = await connect(handler, "ann")
+        bob = await connect(handler, "bob")
+        cat = await connect(handler, "cat")
+        ann.send("READY")
+        cat.send("READY")
+        await cat.expect("status")
+        cat.send("SPECTATE")
+        await cat.expect("spectate")
+        # Only ann and bob are playing now, so bob's READY starts the game
+        bob.send("READY")
+        done, _ = await asyncio.wait([asyncio.create_task(p.expect("word_options", timeout=3)) for p in (ann, bob)],
+                                     return_when=asyncio.FIRST_COMPLETED)
+        assert done.pop().result()["type"] == "word_options"
+        assert not cat.of_type("word_options")
+        for player in (ann, bob, cat):
+            player.close()
+    asyncio.run(run())
+
+def test_players_cannot_spectate_their_own_game(server):
+    async def run():
+        drawer, guessers, players = await start_round(server)
+        guessers[0].send("SPECTATE")
+        await asyncio.sleep(0.3)
+        assert "spectate once" in guessers[0].of_type("status")[-1]["message"]
+        assert not guessers[0].of_type("spectate") and not server.spectator_feed.spectators
+        for player in players:
+            player.close()
+    asyncio.run(run())
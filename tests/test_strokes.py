@@ -0,0 +1,45 @@
+import asyncio
+
+import bench_game
+import memory_transport
+from scribble import CONGESTION_QUEUE, RateController, decimate
+
+def draw(x, y, start_new=False, color="black"):
+    return {"type": "draw", "x": x, "y": y, "color": color, "start_new": start_new}
+
+def test_decimate_keeps_every_erase_in_order():
+    batch = [draw(0, 0, True), draw(1, 0), {"type": "erase", "x": 5, "y": 5}, draw(2, 0), draw(3, 0),
+             {"type": "erase", "x": 6, "y": 6}, {"type": "erase", "x": 7, "y": 7}, draw(4, 0)]
+    kept = decimate(batch, 10.0)
+    assert [(m["x"], m["y"]) for m in kept if m["type"] == "erase"] == [(5, 5), (6, 6), (7, 7)]
+
+def test_decimate_keeps_stroke_boundaries():
+    batch = [draw(x, 0, x == 0) for x in range(10)] + [draw(x, 0, color="red") for x in range(10, 20)]
+    kept = decimate(batch, 100.0)
+    assert [(m["x"], m["color"]) for m in kept] == [(0, "black"), (9, "black"), (10, "red"), (19, "red")]
+
+def test_rate_controller_backs_off_and_recovers():
+    rate = RateController(0.02, 0.0, 0.3, 6.0)
+    for _ in range(10):
+        rate.update(True)
+    assert (rate.interval, rate.tolerance) == (0.3, 6.0)
+    for _ in range(100):
+        rate.update(False)
+    assert (round(rate.interval, 6), rate.tolerance) == (0.02, 0.0)
+
+def test_tcp_outbox_counts_towards_congestion(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = bench_game.load_server("tcp", str(tmp_path))
+
+    async def run():
+        reader, writer = await memory_transport.open_connection(lambda reader, writer: None)
+        client = server.Client(writer, reader, None)
+        client.queue(b"x" * CONGESTION_QUEUE)
+        assert not client.congested()
+        # Still in the outbox, the transport has not seen any of it yet
+        client.queue(b"x")
+        assert client.congested() and client.backlog() == CONGESTION_QUEUE + 1
+        await asyncio.sleep(0)
+        assert client.backlog() == 0 and not client.congested()
+        writer.close()
+    asyncio.run(run())
@@ -0,0 +1,21 @@
+import datetime
+
+import bench_game
+from aioquic.tls import CipherSuite, SessionTicket
+
+def ticket(label, lifetime=3600):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return SessionTicket(age_add=0, cipher_suite=CipherSuite.AES_128_GCM_SHA256, not_valid_after=now + datetime.timedelta(seconds=lifetime),
+                         not_valid_before=now, resumption_secret=b"", server_name="localhost", ticket=label)
+
+def test_ticket_store_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = bench_game.load_server("quic", str(tmp_path))
+    server.MAX_SESSION_TICKETS = 3
+    server.store_ticket(ticket(b"stale", lifetime=-1))
+    for i in range(5):
+        server.store_ticket(ticket(b"t%d" % i))
+    assert list(server.session_tickets) == [b"t2", b"t3", b"t4"]
+    assert server.fetch_ticket(b"t3").ticket == b"t3"
+    assert server.fetch_ticket(b"t3") is None
+    assert server.fetch_ticket(b"t0") is None